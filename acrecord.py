@@ -1,4 +1,9 @@
+import json
+import os
 from collections import defaultdict
+from typing import Union
+
+_id_prefix = '{"telegram_id": '
 
 
 class AcRecord:
@@ -32,3 +37,135 @@ class AcRecord:
         obj.refused = data['refused']
 
         return obj
+
+
+def whitelist_reason_of(data: dict, chat_id: int) -> str:
+    """
+    iter_raw 给出的字典中 whitelist_reason 的键为 int（已构建的 AcRecord）或 str（尚未解析的记录）
+    """
+    reasons = data['whitelist_reason']
+    return reasons.get(chat_id) or reasons.get(str(chat_id)) or ''
+
+
+def _line_telegram_id(line: str) -> int:
+    """
+    dump_file 写出的行以 telegram_id 开头，直接截取；其他工具改写过的行则完整解析
+    """
+    if line.startswith(_id_prefix):
+        end = line.find(',', len(_id_prefix))
+        try:
+            return int(line[len(_id_prefix):end])
+        except ValueError:
+            pass
+    return json.loads(line)['telegram_id']
+
+
+class AcRecordStore:
+    """
+    AcRecord 的容器，按 telegram_id 索引
+    启动时只保存原始数据（记录文件中的字典，或 JSON Lines 文件中未解析的行），
+    某条记录第一次被访问时才构建 AcRecord；索引在第一次查找时建立，同一 telegram_id 有多条记录时以第一条为准。
+    与 bot.ac_record 的其他操作一样，调用方需持有 t_lock
+    """
+    def __init__(self, items: Union[list, None] = None):
+        self._items: list[Union[str, dict, AcRecord]] = items if items is not None else []
+        self._index: Union[dict[int, int], None] = None
+
+    @classmethod
+    def from_file(cls, path: str, fallback: Union[list[dict], None] = None):
+        """
+        读取 JSON Lines 记录文件（每行一个 JSON 对象），只分行而不解析。
+        文件不存在时使用 fallback（例如旧版保存在 record['ac'] 中的记录）
+        """
+        try:
+            with open(path, encoding='utf-8') as f:
+                lines = [line for line in f.read().splitlines() if line]
+        except FileNotFoundError:
+            return cls(fallback)
+        return cls(lines)
+
+    def dump_file(self, path: str):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for item in self._items:
+                if isinstance(item, str):
+                    f.write(item)
+                else:
+                    data = item.to_dict() if isinstance(item, AcRecord) else item
+                    # telegram_id 放在第一个键，建立索引时不必解析整行
+                    f.write(json.dumps({'telegram_id': data['telegram_id'], **data}, ensure_ascii=False))
+                f.write('\n')
+        os.replace(tmp_path, path)
+
+    def to_list(self) -> list[dict]:
+        return list(self.iter_raw())
+
+    def iter_raw(self):
+        """
+        依次给出每条记录的字典形式，不构建 AcRecord
+        """
+        for item in self._items:
+            if isinstance(item, str):
+                yield json.loads(item)
+            elif isinstance(item, AcRecord):
+                yield item.to_dict()
+            else:
+                yield item
+
+    def snapshot(self):
+        """
+        返回供后台线程在不持有 t_lock 时读取的副本：原始数据不会被修改，直接共享；
+        已构建的 AcRecord 复制为字典。复制只需遍历一次列表，调用方需持有 t_lock
+        """
+        return AcRecordStore([dict(x.to_dict()) if isinstance(x, AcRecord) else x for x in self._items])
+
+    def get(self, telegram_id: int) -> Union[AcRecord, None]:
+        if self._index is None:
+            self._build_index()
+        i = self._index.get(telegram_id)
+        if i is None:
+            return None
+        return self._materialize(i)
+
+    def get_or_create(self, telegram_id: int) -> AcRecord:
+        ac_record = self.get(telegram_id)
+        if ac_record is None:
+            ac_record = AcRecord(telegram_id)
+            self.append(ac_record)
+        return ac_record
+
+    def append(self, ac_record: AcRecord):
+        if self._index is not None:
+            self._index.setdefault(ac_record.telegram_id, len(self._items))
+        self._items.append(ac_record)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        """
+        会为每条记录构建并保留 AcRecord，只读的遍历请用 iter_raw
+        """
+        for i in range(len(self._items)):
+            yield self._materialize(i)
+
+    def _build_index(self):
+        index = {}
+        for i, item in enumerate(self._items):
+            if isinstance(item, str):
+                index.setdefault(_line_telegram_id(item), i)
+            elif isinstance(item, AcRecord):
+                index.setdefault(item.telegram_id, i)
+            else:
+                index.setdefault(item['telegram_id'], i)
+        self._index = index
+
+    def _materialize(self, i: int) -> AcRecord:
+        item = self._items[i]
+        if isinstance(item, AcRecord):
+            return item
+        if isinstance(item, str):
+            item = json.loads(item)
+        ac_record = AcRecord.from_dict(item)
+        self._items[i] = ac_record
+        return ac_record
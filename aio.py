@@ -0,0 +1,283 @@
+"""
+asyncio 执行模式（config 中 async_mode 为 true 时启用）
+需要额外安装 aiohttp：pip install telegram-mediawiki-confirm-bot[async]
+"""
+import asyncio
+import concurrent.futures
+import threading
+import time
+from typing import Callable, Union
+
+import aiohttp
+import catbot
+
+USER_AGENT = f'Telegram-MediaWiki-Confirm-Bot/0.1.0 (https://github.com/The-Earth/Telegram-MediaWiki-Confirm-Bot) ' \
+             f'aiohttp/{aiohttp.__version__}'
+
+_api_errors = [
+    ('not enough rights', catbot.InsufficientRightError),
+    ('user is an administrator', catbot.RestrictAdminError),
+    ("can't remove chat owner", catbot.RestrictAdminError),
+    ("can't restrict self", catbot.RestrictAdminError),
+    ('user not found', catbot.UserNotFoundError),
+    ('participant_id_invalid', catbot.UserNotFoundError),
+    ('member not found', catbot.UserNotFoundError),
+    ('message to delete not found', catbot.DeleteMessageError),
+    ("message can't be deleted", catbot.DeleteMessageError),
+]
+
+_send_permissions = [
+    'can_send_messages', 'can_send_audios', 'can_send_documents', 'can_send_photos', 'can_send_videos',
+    'can_send_video_notes', 'can_send_voice_notes', 'can_send_polls', 'can_send_other_messages',
+    'can_add_web_page_previews',
+]
+
+
+class ChatMember:
+    """
+    getChatMember 结果中 handler 用到的字段，与 catbot.ChatMember 同名
+    """
+    def __init__(self, raw: dict):
+        self.raw = raw
+        self.status: str = raw['status']
+        self.id: int = raw['user']['id']
+        self.is_bot: bool = raw['user']['is_bot']
+        self.name: str = raw['user']['first_name'] + (' ' + raw['user']['last_name'] if 'last_name' in raw['user'] else '')
+        self.until_date: int = raw.get('until_date', 0)
+        self.is_member: bool = raw.get('is_member', False)
+
+
+class AsyncTelegram:
+    def __init__(self, token: str, session: aiohttp.ClientSession, proxy: Union[str, None] = None):
+        self.base_url = f'https://api.telegram.org/bot{token}/'
+        self.session = session
+        self.proxy = proxy
+
+    async def api(self, method: str, data: dict, timeout: float = 30):
+        async with self.session.post(self.base_url + method, json=data, proxy=self.proxy,
+                                     timeout=aiohttp.ClientTimeout(total=timeout)) as res:
+            body = await res.json()
+        if body['ok']:
+            return body['result']
+
+        description: str = body.get('description', '')
+        for keyword, error in _api_errors:
+            if keyword in description.lower():
+                raise error(description)
+        raise catbot.APIError(description)
+
+    async def get_updates(self, offset: Union[int, None], timeout: int = 30) -> list[dict]:
+        data = {'timeout': timeout, 'allowed_updates': ['message', 'callback_query', 'chat_member']}
+        if offset is not None:
+            data['offset'] = offset
+        return await self.api('getUpdates', data, timeout=timeout + 10)
+
+    async def send_message(self, chat_id: int, **kwargs) -> dict:
+        return await self.api('sendMessage', {'chat_id': chat_id, **kwargs})
+
+    async def edit_message(self, chat_id: int, msg_id: int, **kwargs) -> dict:
+        return await self.api('editMessageText', {'chat_id': chat_id, 'message_id': msg_id, **kwargs})
+
+    async def answer_callback_query(self, callback_query_id: str, **kwargs):
+        return await self.api('answerCallbackQuery', {'callback_query_id': callback_query_id, **kwargs})
+
+    async def get_chat_member(self, chat_id: int, user_id: int) -> ChatMember:
+        return ChatMember(await self.api('getChatMember', {'chat_id': chat_id, 'user_id': user_id}))
+
+    async def silence_chat_member(self, chat_id: int, user_id: int):
+        await self.api('restrictChatMember', {
+            'chat_id': chat_id,
+            'user_id': user_id,
+            'permissions': {x: False for x in _send_permissions}
+        })
+
+    async def lift_restrictions(self, chat_id: int, user_id: int):
+        await self.api('restrictChatMember', {
+            'chat_id': chat_id,
+            'user_id': user_id,
+            'permissions': {x: True for x in _send_permissions}
+        })
+
+    async def kick_chat_member(self, chat_id: int, user_id: int):
+        await self.api('banChatMember', {'chat_id': chat_id, 'user_id': user_id})
+
+    async def delete_message(self, chat_id: int, msg_id: int):
+        await self.api('deleteMessage', {'chat_id': chat_id, 'message_id': msg_id})
+
+
+class AsyncMediaWiki:
+    def __init__(self, host: str, session: aiohttp.ClientSession, proxy: Union[str, None] = None, path: str = '/w/'):
+        self.url = f'https://{host}{path}api.php'
+        self.session = session
+        self.proxy = proxy
+
+    async def api(self, **params) -> dict:
+        async with self.session.get(self.url, params=params, proxy=self.proxy) as res:
+            return await res.json()
+
+
+class AsyncClients:
+    """
+    async 模式下共享的 HTTP 连接池及 Telegram、MediaWiki 客户端，需在事件循环中调用 start()
+    """
+    def __init__(self, config: dict):
+        self.config = config
+        self.proxy: Union[str, None] = config['proxy']['proxy_url'] if config['proxy']['enable'] else None
+        self.session: Union[aiohttp.ClientSession, None] = None
+        self.telegram: Union[AsyncTelegram, None] = None
+        self.mediawiki: Union[AsyncMediaWiki, None] = None
+
+    async def start(self):
+        connector = aiohttp.TCPConnector(
+            limit=self.config.get('async_pool_size', 100),
+            limit_per_host=self.config.get('async_pool_size_per_host', 50)
+        )
+        # Wikimedia 要求 User-Agent 能识别出客户端及联系方式，可用 config 中的 user_agent 替换
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            headers={'User-Agent': self.config.get('user_agent', USER_AGENT)}
+        )
+        self.telegram = AsyncTelegram(self.config['token'], self.session, self.proxy)
+        self.mediawiki = AsyncMediaWiki(self.config['main_site'], self.session, self.proxy)
+
+    async def close(self):
+        await self.session.close()
+
+    async def post_json(self, url: str, payload: dict) -> Union[dict, None]:
+        """
+        返回 200 响应的 JSON；连接失败或其他状态码时返回 None
+        """
+        try:
+            async with self.session.post(url, json=payload, proxy=self.proxy) as res:
+                if res.status != 200:
+                    return None
+                return await res.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return None
+
+
+class ThreadLockAdapter:
+    """
+    在协程中使用 profiler.ContendedLock：未争用时直接获得，否则排在一个 asyncio.Lock 之后，
+    同一时刻只有排在最前的协程以逐渐加长的间隔重试，并登记在锁的 waiting 中供 SamplingProfiler 标注。
+    等待时不占用线程，等待中的任务被取消时也不会在之后获得锁。持有期间不应 await
+    """
+    def __init__(self, lock, max_delay: float = 0.01):
+        self._lock = lock
+        self._max_delay = max_delay
+        self._queue = asyncio.Lock()
+
+    async def __aenter__(self):
+        if not self._queue.locked() and self._lock.acquire(False):
+            return
+        async with self._queue:
+            ident = threading.get_ident()
+            self._lock.waiting.add(ident)
+            try:
+                delay = 0.0005
+                while not self._lock.acquire(False):
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, self._max_delay)
+            finally:
+                self._lock.waiting.discard(ident)
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self._lock.release()
+
+
+class AsyncRunner:
+    """
+    在单个事件循环中轮询并分发更新。tasks 的结构为 {更新类型: [(criteria, handler), ...]}，
+    协程 handler 直接在事件循环中执行，普通 handler 交给有界线程池，同时处理的更新数不超过 max_inflight。
+    recorder 不为 None 时，每个更新在分发前交给它录制；on_handled 在每个 handler 结束后以
+    (handler 名称, 自更新到达起的秒数) 调用
+    """
+    update_types = {
+        'message': catbot.Message,
+        'callback_query': catbot.CallbackQuery,
+        'chat_member': catbot.ChatMemberUpdate,
+    }
+
+    def __init__(self, clients: AsyncClients, tasks: dict[str, list[tuple[Callable, Callable]]],
+                 max_inflight: int = 1000, max_workers: int = 16, recorder=None,
+                 on_handled: Union[Callable[[str, float], None], None] = None):
+        self.clients = clients
+        self.tasks = tasks
+        self.max_inflight = max_inflight
+        self.recorder = recorder
+        self.on_handled = on_handled
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+        self._inflight: Union[asyncio.Semaphore, None] = None
+        self._running_tasks: set[asyncio.Task] = set()
+        self._stop = threading.Event()
+
+    def start(self):
+        try:
+            asyncio.run(self.run())
+        finally:
+            self.executor.shutdown(wait=True)
+
+    def stop(self):
+        self._stop.set()
+
+    def open(self):
+        """
+        需在事件循环中、第一次 dispatch 之前调用（run 会调用）
+        """
+        self._inflight = asyncio.Semaphore(self.max_inflight)
+
+    async def run(self):
+        self.open()
+        await self.clients.start()
+        offset = None
+        try:
+            while not self._stop.is_set():
+                try:
+                    updates = await self.clients.telegram.get_updates(offset)
+                except (aiohttp.ClientError, asyncio.TimeoutError, catbot.APIError) as e:
+                    print(f'[Error] getUpdates failed: {e}')
+                    await asyncio.sleep(1)
+                    continue
+                for update in updates:
+                    offset = update['update_id'] + 1
+                    if self.recorder is not None:
+                        self.recorder.record_update(update)
+                    await self.dispatch(update)
+        finally:
+            await self.clients.close()
+
+    async def dispatch(self, update: dict):
+        arrived = time.perf_counter()
+        for update_type, cls in self.update_types.items():
+            if update_type in update:
+                obj = cls(update[update_type])
+                break
+        else:
+            return
+
+        for criteria, handler in self.tasks.get(update_type, []):
+            if criteria(obj):
+                await self._inflight.acquire()
+                task = asyncio.create_task(self._run_handler(handler, obj, arrived))
+                self._running_tasks.add(task)
+                task.add_done_callback(self._running_tasks.discard)
+
+    async def drain(self):
+        """
+        等待已分发的 handler 全部结束
+        """
+        while self._running_tasks:
+            await asyncio.gather(*self._running_tasks)
+
+    async def _run_handler(self, handler: Callable, obj, arrived: float):
+        try:
+            if asyncio.iscoroutinefunction(handler):
+                await handler(obj)
+            else:
+                await asyncio.get_running_loop().run_in_executor(self.executor, handler, obj)
+        except Exception as e:
+            print(f'[Error] {handler.__name__}: {e!r}')
+        finally:
+            self._inflight.release()
+            if self.on_handled is not None:
+                self.on_handled(handler.__name__, time.perf_counter() - arrived)
@@ -0,0 +1,55 @@
+import csv
+import io
+import json
+
+
+def parse_id_tokens(tokens: list[str]) -> tuple[list[int], list[str]]:
+    """
+    从指令参数开头读取任意多个 Telegram ID（可用空格、换行或逗号分隔），
+    遇到第一个不全是数字的参数时停止，该参数整个留在剩余参数中。返回 ID 列表（可能有重复）与剩余参数
+    """
+    ids = []
+    for i, token in enumerate(tokens):
+        try:
+            token_ids = [int(x) for x in token.split(',') if x]
+        except ValueError:
+            return ids, tokens[i:]
+        ids.extend(token_ids)
+    return ids, []
+
+
+def parse_whitelist_file(content: bytes, default_reason: str) -> tuple[dict[int, str], int]:
+    """
+    解析白名单文件。JSON 可以是 ID 列表、{"telegram_id": ..., "reason": ...} 列表，
+    或带有 "whitelist" 键的对象；CSV 第一列为 ID，第二列为备注（可省略），可以有表头。
+    返回 ID -> 备注，以及跳过的条目数（无法解析的行或条目与重复的 ID，重复时以第一次出现的为准）
+    """
+    text = content.decode('utf-8-sig')
+    entries: dict[int, str] = {}
+    total = 0
+    if text.lstrip()[:1] in ('[', '{'):
+        data = json.loads(text)
+        if isinstance(data, dict):
+            data = data['whitelist']
+        for item in data:
+            total += 1
+            try:
+                if isinstance(item, dict):
+                    entries.setdefault(int(item['telegram_id']), item.get('reason') or default_reason)
+                else:
+                    entries.setdefault(int(item), default_reason)
+            except (ValueError, KeyError, TypeError):
+                continue
+    else:
+        for i, row in enumerate(csv.reader(io.StringIO(text))):
+            if not row:
+                continue
+            try:
+                tg_id = int(row[0])
+            except ValueError:
+                if i > 0:
+                    total += 1
+                continue
+            total += 1
+            entries.setdefault(tg_id, row[1] if len(row) > 1 and row[1] else default_reason)
+    return entries, total - len(entries)
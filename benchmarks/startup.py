@@ -0,0 +1,83 @@
+"""
+启动耗时基准测试
+比较三种加载方式在 N 条记录下的耗时与内存峰值：
+    eager      旧方式：json.load 记录文件后为每条记录构建 AcRecord
+    lazy_json  json.load 记录文件后交给 AcRecordStore，不构建 AcRecord
+    lazy_jsonl 使用 ac_record_file（JSON Lines），只分行不解析
+每种方式在独立子进程中运行，以便分别统计内存峰值。"first lookup" 为首次按 ID 查找（建立索引）的耗时
+
+用法：python benchmarks/startup.py [N ...]，默认 N 为 100000 与 1000000
+"""
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from acrecord import AcRecord, AcRecordStore  # noqa: E402
+
+CASES = ['eager', 'lazy_json', 'lazy_jsonl']
+
+
+def generate(n: int, workdir: str):
+    records = []
+    for i in range(n):
+        ac_record = AcRecord(100000000 + i)
+        ac_record.confirmed = i % 3 == 0
+        ac_record.mw_id = i if ac_record.confirmed else -1
+        ac_record.confirmed_time = 1700000000.0 + i
+        if i % 10 == 0:
+            ac_record.whitelist_reason[-100123456789] = 'whitelisted'
+        records.append(ac_record)
+
+    with open(os.path.join(workdir, 'record.json'), 'w', encoding='utf-8') as f:
+        json.dump({'ac': [x.to_dict() for x in records]}, f)
+    AcRecordStore(records).dump_file(os.path.join(workdir, 'ac_record.jsonl'))
+
+
+def run_case(case: str, workdir: str):
+    start = time.perf_counter()
+    if case == 'eager':
+        with open(os.path.join(workdir, 'record.json'), encoding='utf-8') as f:
+            record = json.load(f)
+        store = AcRecordStore([AcRecord.from_dict(x) for x in record['ac']])
+    elif case == 'lazy_json':
+        with open(os.path.join(workdir, 'record.json'), encoding='utf-8') as f:
+            record = json.load(f)
+        store = AcRecordStore(record['ac'])
+    else:
+        store = AcRecordStore.from_file(os.path.join(workdir, 'ac_record.jsonl'))
+    ready = time.perf_counter() - start
+
+    start = time.perf_counter()
+    store.get(100000000)
+    first_lookup = time.perf_counter() - start
+
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({'ready': ready, 'first_lookup': first_lookup, 'peak_mb': peak_mb}))
+
+
+def main(sizes: list[int]):
+    print(f'{"N":>9} {"case":<11} {"ready (s)":>10} {"first lookup (s)":>17} {"peak RSS (MB)":>14}')
+    for n in sizes:
+        with tempfile.TemporaryDirectory() as workdir:
+            generate(n, workdir)
+            for case in CASES:
+                out = subprocess.run(
+                    [sys.executable, __file__, '--case', case, workdir],
+                    capture_output=True, text=True, check=True
+                ).stdout
+                result = json.loads(out)
+                print(f'{n:>9} {case:<11} {result["ready"]:>10.3f} {result["first_lookup"]:>17.3f} '
+                      f'{result["peak_mb"]:>14.1f}')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--case':
+        run_case(sys.argv[2], sys.argv[3])
+    else:
+        main([int(x) for x in sys.argv[1:]] or [100000, 1000000])
@@ -0,0 +1,109 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Union
+
+
+class EligibilityResult:
+    def __init__(self, mw_id: int, eligible: bool, reason: str, wiki: str = ''):
+        self.mw_id = mw_id
+        self.eligible = eligible
+        self.reason = reason
+        """
+        eligible / not_found / locked / ineligible
+        """
+        self.wiki = wiki
+        """
+        达到门槛的站点（dbname），仅在 eligible 时有值
+        """
+        self.checked_time = time.time()
+
+    def to_dict(self):
+        return self.__dict__
+
+
+class EligibilityEngine:
+    """
+    根据 config 中的 eligibility 设置检查 globaluserinfo 的结果
+    只要有一个合并账户满足全部条件即判定达到门槛，找到后立即返回。
+    单个账户的检查按开销从低到高排列，可通过 account_checks 追加
+    """
+    def __init__(self, config: dict, wiki_list: list[str]):
+        self.min_edits: int = config.get('min_edits', 50)
+        self.min_age: float = config.get('min_age_days', 7) * 86400
+        self.wikis: Union[set[str], None] = set(wiki_list) if config.get('use_wiki_list', False) else None
+        """
+        None 表示检查所有站点
+        """
+        self.reject_locked: bool = config.get('reject_locked', False)
+        self.reject_blocked: bool = config.get('reject_blocked', False)
+        self.cache_ttl: float = config.get('cache_ttl', 300)
+        self._cache: OrderedDict[int, EligibilityResult] = OrderedDict()
+        """
+        按写入时间排序，写入时顺带清除过期的结果
+        """
+        self._cache_lock = threading.Lock()
+
+        self.account_checks: list[Callable[[dict, str], bool]] = [
+            lambda account, cutoff: account['editcount'] >= self.min_edits
+        ]
+        if self.wikis is not None:
+            self.account_checks.append(lambda account, cutoff: account['wiki'] in self.wikis)
+        if self.reject_blocked:
+            self.account_checks.append(lambda account, cutoff: 'blocked' not in account)
+        # 时间戳格式固定为 %Y-%m-%dT%H:%M:%SZ，可直接按字符串比较；缺少注册时间的是很早以前注册的账户
+        self.account_checks.append(lambda account, cutoff: (account.get('registration') or '') < cutoff)
+
+    def check(self, mw_id: int, fetch: Callable[[int], dict]) -> EligibilityResult:
+        """
+        fetch 返回 globaluserinfo 查询结果（需包含 guiprop=merged）。
+        达到门槛的结果在 cache_ttl 秒内会被缓存；未达到门槛的结果不缓存，用户补足编辑后可立即重试
+        """
+        cached = self._cached(mw_id)
+        if cached is not None:
+            return cached
+        return self._store(self.evaluate(mw_id, fetch(mw_id)))
+
+    async def check_async(self, mw_id: int, fetch: Callable[[int], Awaitable[dict]]) -> EligibilityResult:
+        """
+        check 的协程版本，fetch 为协程函数
+        """
+        cached = self._cached(mw_id)
+        if cached is not None:
+            return cached
+        return self._store(self.evaluate(mw_id, await fetch(mw_id)))
+
+    def evaluate(self, mw_id: int, global_user_info_query: dict) -> EligibilityResult:
+        if 'error' in global_user_info_query.keys():
+            return EligibilityResult(mw_id, False, 'not_found')
+
+        global_user_info = global_user_info_query['query']['globaluserinfo']
+        if self.reject_locked and global_user_info.get('locked'):
+            return EligibilityResult(mw_id, False, 'locked')
+
+        cutoff = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(time.time() - self.min_age))
+        for account in global_user_info['merged']:
+            if all(check(account, cutoff) for check in self.account_checks):
+                return EligibilityResult(mw_id, True, 'eligible', account['wiki'])
+
+        return EligibilityResult(mw_id, False, 'ineligible')
+
+    def _cached(self, mw_id: int) -> Union[EligibilityResult, None]:
+        with self._cache_lock:
+            cached = self._cache.get(mw_id)
+        if cached is not None and time.time() - cached.checked_time < self.cache_ttl:
+            return cached
+        return None
+
+    def _store(self, result: EligibilityResult) -> EligibilityResult:
+        if not result.eligible:
+            return result
+        with self._cache_lock:
+            self._cache.pop(result.mw_id, None)
+            self._cache[result.mw_id] = result
+            while self._cache:
+                oldest = next(iter(self._cache.values()))
+                if result.checked_time - oldest.checked_time < self.cache_ttl:
+                    break
+                self._cache.popitem(last=False)
+        return result
@@ -1,6 +1,8 @@
-import threading
+import asyncio
+import csv
+import io
+import json
 import time
-from calendar import timegm
 from typing import Union
 import re
 
@@ -9,7 +11,14 @@ import mwclient
 from catbot.util import html_escape
 import requests
 
-from acrecord import AcRecord
+from acrecord import AcRecord, AcRecordStore, whitelist_reason_of
+from batch import parse_id_tokens, parse_whitelist_file
+from eligibility import EligibilityEngine, EligibilityResult
+from mwindex import MwUsernameIndex
+from profiler import ContendedLock, SamplingProfiler
+from ratelimit import RateLimitedWorker, is_rate_limited
+from replay import UpdateRecorder
+from stats import GroupStats
 
 from utils import partly_mosaic_name
 
@@ -17,125 +26,204 @@ from utils import partly_mosaic_name
 class AcBot(catbot.Bot):
     def __init__(self, config_path='config.json'):
         super(AcBot, self).__init__(config_path=config_path)
-        if 'ac' in self.record:
-            self.ac_record: list[AcRecord] = [AcRecord.from_dict(x) for x in self.record['ac']]
+        if 'ac_record_file' in self.config:
+            self.ac_record = AcRecordStore.from_file(self.config['ac_record_file'], fallback=self.record.get('ac'))
         else:
-            self.ac_record: list[AcRecord] = []
+            self.ac_record = AcRecordStore(self.record.get('ac'))
+        self.mw_index = MwUsernameIndex(self.record.get('mw_index'))
+        if 'stats' in self.record:
+            self.stats = GroupStats(self.record['stats'], history_days=self.config.get('stats_history_days', 90))
+        else:
+            self.stats = GroupStats.rebuild(self.ac_record.iter_raw(), history_days=self.config.get('stats_history_days', 90))
+        if 'update_record' in self.config:
+            self.recorder = UpdateRecorder(
+                self.config['update_record']['path'],
+                anonymize=self.config['update_record'].get('anonymize', False),
+                groups=self.config['groups'],
+                log_channel=self.config['log_channel']
+            )
+        else:
+            self.recorder = None
+
+    def get_updates(self, *args, **kwargs):
+        """
+        catbot 轮询时取得的更新都经过这里，启用 update_record 时在分发前录制
+        """
+        updates = super().get_updates(*args, **kwargs)
+        if self.recorder is not None:
+            for update in updates:
+                self.recorder.record_update(update)
+        return updates
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.record['ac'] = [x.to_dict() for x in self.ac_record]
+        if 'ac_record_file' in self.config:
+            self.ac_record.dump_file(self.config['ac_record_file'])
+            self.record.pop('ac', None)
+        else:
+            self.record['ac'] = self.ac_record.to_list()
+        self.record['mw_index'] = self.mw_index.dump()
+        self.record['stats'] = self.stats.dump()
         super().__exit__(exc_type, exc_val, exc_tb)
 
 
 bot = AcBot(config_path='config.json')
-t_lock = threading.Lock()
+t_lock = ContendedLock('t_lock')
+profiler = SamplingProfiler(__file__, [t_lock])
 site = mwclient.Site(bot.config['main_site'], connection_options={'proxies': bot.proxies})
+eligibility = EligibilityEngine(bot.config.get('eligibility', {}), bot.config.get('wiki_list', []))
+restriction_worker = RateLimitedWorker(bot.config.get('batch_rate_limit', 10), burst=5)
 
 
 def log(text):
     bot.send_message(bot.config['log_channel'], text=text, parse_mode='HTML', disable_web_page_preview=True)
 
 
-def silence_trial(ac_record: AcRecord, chat_id: int, alert=False):
-    member = bot.get_chat_member(chat_id, ac_record.telegram_id)
-    if member.status == 'kicked':
-        return
-    if not (ac_record.confirmed or ac_record.whitelist_reason[chat_id]):
-        try:
-            bot.silence_chat_member(chat_id, ac_record.telegram_id)
-            if alert:
-                bot.send_message(chat_id, text=bot.config['messages']['silence_alert'].format(
-                    name=member.name,
-                    tg_id=ac_record.telegram_id,
-                ), parse_mode='HTML')
-        except catbot.InsufficientRightError:
-            if alert:
-                bot.send_message(chat_id, text=bot.config['messages']['insufficient_right'])
-        except catbot.RestrictAdminError:
-            pass
-        except catbot.UserNotFoundError:
-            pass
+def send_document(chat_id: int, filename: str, content: bytes, caption: str = '', **kwargs):
+    res = requests.post(
+        f'https://api.telegram.org/bot{bot.config["token"]}/sendDocument',
+        data={'chat_id': chat_id, 'caption': caption, **kwargs},
+        files={'document': (filename, content)},
+        proxies=bot.proxies
+    )
+    if not res.json()['ok']:
+        raise catbot.APIError(res.json()['description'])
 
 
-def lift_restriction_trial(ac_record: AcRecord, chat_id: int, alert=False):
-    member = bot.get_chat_member(chat_id, ac_record.telegram_id)
+def download_document(file_id: str) -> bytes:
+    res = requests.post(
+        f'https://api.telegram.org/bot{bot.config["token"]}/getFile',
+        json={'file_id': file_id},
+        proxies=bot.proxies
+    )
+    if not res.json()['ok']:
+        raise catbot.APIError(res.json()['description'])
+    file_path = res.json()['result']['file_path']
+    return requests.get(
+        f'https://api.telegram.org/file/bot{bot.config["token"]}/{file_path}',
+        proxies=bot.proxies
+    ).content
+
+
+def restriction_alert(key: str, member, ac_record: AcRecord) -> str:
+    return bot.config['messages'][key].format(name=member.name, tg_id=ac_record.telegram_id)
+
+
+def restriction_failure(e: catbot.APIError, alert: bool, ignore_other: bool = False) -> Union[str, None]:
+    """
+    禁言或解除禁言失败时的处理，返回需在群里发送的提示（只有权限不足且 alert 时才有）。
+    对方是管理员或已不在群内时忽略；其他错误在 ignore_other 为 False 时继续抛出
+    """
+    if isinstance(e, catbot.InsufficientRightError):
+        return bot.config['messages']['insufficient_right'] if alert else None
+    elif isinstance(e, (catbot.RestrictAdminError, catbot.UserNotFoundError)) or ignore_other:
+        return None
+    raise e
+
+
+def silence_trial(ac_record: AcRecord, chat_id: int, alert=False):
+    try:
+        member = bot.get_chat_member(chat_id, ac_record.telegram_id)
+    except catbot.UserNotFoundError:
+        return
+    if member.status == 'kicked' or ac_record.confirmed or ac_record.whitelist_reason[chat_id]:
+        return
+    try:
+        bot.silence_chat_member(chat_id, ac_record.telegram_id)
+        text = restriction_alert('silence_alert', member, ac_record) if alert else None
+    except catbot.APIError as e:
+        text = restriction_failure(e, alert)
+    if text:
+        bot.send_message(chat_id, text=text, parse_mode='HTML')
+
+
+def lift_restriction_trial(ac_record: AcRecord, chat_id: int, alert=False, raise_rate_limit=False):
+    """
+    由 restriction_worker 执行时应设置 raise_rate_limit，使 429 交给 worker 等待后重试
+    """
+    try:
+        member = bot.get_chat_member(chat_id, ac_record.telegram_id)
+    except catbot.UserNotFoundError:
+        return
     if member.status == 'kicked':
         return
     try:
         bot.lift_restrictions(chat_id, ac_record.telegram_id)
-        if alert:
-            bot.send_message(chat_id, text=bot.config['messages']['lift_restriction_alert'].format(
-                name=member.name,
-                tg_id=ac_record.telegram_id
-            ), parse_mode='HTML')
-    except catbot.RestrictAdminError:
-        pass
-    except catbot.InsufficientRightError:
-        if alert:
-            bot.send_message(chat_id, text=bot.config['messages']['insufficient_right'])
-    except catbot.UserNotFoundError:
-        pass
-    except catbot.APIError:
-        pass
+        text = restriction_alert('lift_restriction_alert', member, ac_record) if alert else None
+    except catbot.APIError as e:
+        text = restriction_failure(e, alert, ignore_other=not (raise_rate_limit and is_rate_limited(e)))
+    if text:
+        bot.send_message(chat_id, text=text, parse_mode='HTML')
 
 
-def check_eligibility(query: catbot.CallbackQuery, mw_id: int) -> bool:
-    bot.send_message(query.msg.chat.id, text=bot.config['messages']['confirm_checking'])
-    global_user_info_query = site.api(**{
+def global_user_info_params(**kwargs) -> dict:
+    return {
         "action": "query",
         "format": "json",
         "meta": "globaluserinfo",
         "utf8": 1,
         "formatversion": "2",
-        "guiid": mw_id,
-        "guiprop": "merged"
-    })
+        **kwargs
+    }
 
+
+def parse_mw_username(mw_id: int, global_user_info_query: dict) -> Union[str, None]:
     if 'error' in global_user_info_query.keys():
-        bot.send_message(query.msg.chat.id, text=bot.config['messages']['confirm_user_not_found'].format(
-            mw_id=mw_id))
-        return False
+        return None
 
-    global_user_info = global_user_info_query['query']['globaluserinfo']['merged']
-    for local_user in global_user_info:
-        if local_user['editcount'] >= 50 and time.time() - \
-                timegm(time.strptime(local_user['registration'], '%Y-%m-%dT%H:%M:%SZ')) > 7 * 86400:
-            return True
-    else:
-        bot.send_message(query.msg.chat.id, text=bot.config['messages']['confirm_ineligible'])
-        return False
+    name = global_user_info_query['query']['globaluserinfo']['name']
+    bot.mw_index.set_name(mw_id, name)
+    return name
 
 
-def get_mw_username(mw_id: int) -> Union[str, None]:
-    global_user_info_query = site.api(**{
-        "action": "query",
-        "format": "json",
-        "meta": "globaluserinfo",
-        "utf8": 1,
-        "formatversion": "2",
-        "guiid": mw_id,
-    })
-
-    if 'error' in global_user_info_query.keys():
+def parse_mw_id(global_user_info_query: dict) -> Union[int, None]:
+    if 'missing' in global_user_info_query['query']['globaluserinfo'].keys():
         return None
 
-    return global_user_info_query['query']['globaluserinfo']['name']
+    return global_user_info_query['query']['globaluserinfo']['id']
+
+
+def eligibility_reply(result: EligibilityResult) -> Union[str, None]:
+    if result.reason == 'not_found':
+        return bot.config['messages']['confirm_user_not_found'].format(mw_id=result.mw_id)
+    elif not result.eligible:
+        return bot.config['messages']['confirm_ineligible']
+    return None
+
+
+def get_global_user_info(mw_id: int) -> dict:
+    return site.api(**global_user_info_params(guiid=mw_id, guiprop='merged'))
+
+
+def check_eligibility(query: catbot.CallbackQuery, mw_id: int) -> bool:
+    bot.send_message(query.msg.chat.id, text=bot.config['messages']['confirm_checking'])
+    result = eligibility.check(mw_id, get_global_user_info)
+    text = eligibility_reply(result)
+    if text:
+        bot.send_message(query.msg.chat.id, text=text)
+    return result.eligible
+
+
+def get_mw_username(mw_id: int) -> Union[str, None]:
+    return parse_mw_username(mw_id, site.api(**global_user_info_params(guiid=mw_id)))
 
 
 def get_mw_id(mw_username: str) -> Union[int, None]:
-    global_user_info_query = site.api(**{
-        "action": "query",
-        "format": "json",
-        "meta": "globaluserinfo",
-        "utf8": 1,
-        "formatversion": "2",
-        "guiuser": mw_username,
-    })
+    return parse_mw_id(site.api(**global_user_info_params(guiuser=mw_username)))
 
-    if 'missing' in global_user_info_query['query']['globaluserinfo'].keys():
-        return None
 
-    return global_user_info_query['query']['globaluserinfo']['id']
+def confirmed_mw_ids() -> list[tuple[int, int]]:
+    with t_lock:
+        ac_records = bot.ac_record.snapshot()
+    return [(data['mw_id'], data['telegram_id']) for data in ac_records.iter_raw() if data['confirmed']]
+
+
+def find_confirmed_by_mw_id(mw_id: int) -> list[AcRecord]:
+    if bot.mw_index.ready:
+        return [x for x in [bot.ac_record.get(bot.mw_index.owner(mw_id))] if x is not None]
+    return [
+        bot.ac_record.get(data['telegram_id']) for data in bot.ac_record.iter_raw()
+        if data['mw_id'] == mw_id and data['confirmed']
+    ]
 
 
 def match_blacklist(token: str) -> bool:
@@ -150,7 +238,6 @@ def start_cri(msg: catbot.Message) -> bool:
     return bot.detect_command('/start', msg) and msg.chat.type == 'private'
 
 
-@bot.msg_task(start_cri)
 def start(msg: catbot.Message):
     bot.send_message(msg.chat.id, text=bot.config['messages']['start'], parse_mode='HTML')
 
@@ -159,7 +246,6 @@ def policy_cri(msg: catbot.Message) -> bool:
     return bot.detect_command('/policy', msg)
 
 
-@bot.msg_task(policy_cri)
 def policy(msg: catbot.Message):
     bot.send_message(msg.chat.id, text=bot.config['messages']['policy'], parse_mode='HTML')
 
@@ -168,29 +254,39 @@ def confirm_cri(msg: catbot.Message) -> bool:
     return bot.detect_command('/confirm', msg) and msg.chat.type == 'private'
 
 
-@bot.msg_task(confirm_cri)
 def confirm(msg: catbot.Message):
+    # 网络请求期间不持有 t_lock
     with t_lock:
-        records_of_id = list(filter(lambda x: x.telegram_id == msg.from_.id, bot.ac_record))
-        if len(records_of_id) == 0:
+        ac_record = bot.ac_record.get(msg.from_.id)
+        if ac_record is None:
+            state = 'start'
             ac_record = AcRecord(msg.from_.id)
             bot.ac_record.append(ac_record)
             ac_record.confirming = True
+            bot.stats.update(bot.stats.snapshot(None), ac_record)
+        elif ac_record.confirmed:
+            state = 'already'
+        elif ac_record.confirming:
+            state = 'confirming'
+        elif ac_record.refused:
+            state = 'refused'
         else:
-            ac_record: AcRecord = records_of_id[0]
-            if ac_record.confirmed:
-                bot.send_message(msg.chat.id, text=bot.config['messages']['confirm_already'].format(
-                    wp_name=get_mw_username(ac_record.mw_id)
-                ))
-                return
-            elif ac_record.confirming:
-                bot.send_message(msg.chat.id, text=bot.config['messages']['confirm_confirming'])
-                return
-            elif ac_record.refused:
-                bot.send_message(msg.chat.id, text=bot.config['messages']['confirm_ineligible'])
-                return
-            else:
-                ac_record.confirming = True
+            state = 'start'
+            before = bot.stats.snapshot(ac_record)
+            ac_record.confirming = True
+            bot.stats.update(before, ac_record)
+
+    if state == 'already':
+        bot.send_message(msg.chat.id, text=bot.config['messages']['confirm_already'].format(
+            wp_name=get_mw_username(ac_record.mw_id)
+        ))
+        return
+    elif state == 'confirming':
+        bot.send_message(msg.chat.id, text=bot.config['messages']['confirm_confirming'])
+        return
+    elif state == 'refused':
+        bot.send_message(msg.chat.id, text=bot.config['messages']['confirm_ineligible'])
+        return
 
     button = catbot.InlineKeyboardButton(bot.config['messages']['confirm_button'], callback_data=f'confirm')
     keyboard = catbot.InlineKeyboard([[button]])
@@ -211,18 +307,16 @@ def confirm_button_cri(query: catbot.CallbackQuery) -> bool:
     return query.data.startswith('confirm') and query.msg.chat.type == 'private'
 
 
-@bot.query_task(confirm_button_cri)
 def confirm_button(query: catbot.CallbackQuery):
     bot.answer_callback_query(callback_query_id=query.id)
     bot.edit_message(query.msg.chat.id, query.msg.id, text=query.msg.html_formatted_text, parse_mode='HTML',
                      disable_web_page_preview=True)
     with t_lock:
-        records_of_id = list(filter(lambda x: x.telegram_id == query.from_.id, bot.ac_record))
-        if len(records_of_id) == 0:
+        ac_record = bot.ac_record.get(query.from_.id)
+        if ac_record is None:
             bot.send_message(query.msg.chat.id, text=bot.config['messages']['confirm_session_lost'])
             return
         else:
-            ac_record: AcRecord = records_of_id[0]
             if ac_record.confirmed:
                 bot.send_message(query.msg.chat.id, text=bot.config['messages']['confirm_already'].format(
                     wp_name=get_mw_username(ac_record.mw_id)
@@ -232,6 +326,7 @@ def confirm_button(query: catbot.CallbackQuery):
                 bot.send_message(query.msg.chat.id, text=bot.config['messages']['confirm_session_lost'])
                 return
 
+        before = bot.stats.snapshot(ac_record)
         try:
             res = requests.post(
                 bot.config['oauth_query_url'],
@@ -247,7 +342,7 @@ def confirm_button(query: catbot.CallbackQuery):
                 mw_id: int = res.json()['mw_id']
                 ac_record.mw_id = mw_id
 
-                same_mw_id_record = list(filter(lambda x: x.mw_id == mw_id and x.confirmed, bot.ac_record))
+                same_mw_id_record = find_confirmed_by_mw_id(mw_id)
                 if len(same_mw_id_record) >= 1:
                     bot.send_message(
                         query.msg.chat.id,
@@ -260,7 +355,9 @@ def confirm_button(query: catbot.CallbackQuery):
         finally:
             if ac_record.confirmed:
                 ac_record.confirmed_time = time.time()
+                bot.mw_index.add(ac_record.mw_id, ac_record.telegram_id)
             ac_record.confirming = False
+            bot.stats.update(before, ac_record)
 
     if ac_record.confirmed:
         bot.send_message(query.msg.chat.id, text=bot.config['messages']['confirm_complete'])
@@ -279,7 +376,6 @@ def deconfirm_cri(msg: catbot.Message) -> bool:
     return bot.detect_command('/deconfirm', msg) and msg.chat.type == 'private'
 
 
-@bot.msg_task(deconfirm_cri)
 def deconfirm(msg: catbot.Message):
     button = catbot.InlineKeyboardButton(bot.config['messages']['deconfirm_button'], callback_data='deconfirm')
     keyboard = catbot.InlineKeyboard([[button]])
@@ -290,20 +386,21 @@ def deconfirm_button_cri(query: catbot.CallbackQuery) -> bool:
     return query.data == 'deconfirm' and query.msg.chat.type == 'private'
 
 
-@bot.query_task(deconfirm_button_cri)
 def deconfirm_button(query: catbot.CallbackQuery):
     bot.answer_callback_query(query.id)
 
     with t_lock:
-        records_of_id = list(filter(lambda x: x.telegram_id == query.from_.id, bot.ac_record))
-        if len(records_of_id) == 0:
+        ac_record = bot.ac_record.get(query.from_.id)
+        if ac_record is None:
             bot.send_message(query.msg.chat.id, text=bot.config['messages']['deconfirm_not_confirmed'])
             return
         else:
-            ac_record: AcRecord = records_of_id[0]
             if ac_record.telegram_id == query.from_.id:
                 if ac_record.confirmed:
+                    before = bot.stats.snapshot(ac_record)
                     ac_record.confirmed = False
+                    bot.mw_index.remove(ac_record.mw_id)
+                    bot.stats.update(before, ac_record)
                 else:
                     bot.send_message(query.msg.chat.id, text=bot.config['messages']['deconfirm_not_confirmed'])
                     return
@@ -344,18 +441,37 @@ def new_member_cri(msg: catbot.ChatMemberUpdate) -> bool:
         return False
 
 
-@bot.member_status_task(new_member_cri)
-def new_member(msg: catbot.ChatMemberUpdate):
+def joined_restricted_until(msg: catbot.ChatMemberUpdate) -> Union[int, None]:
+    """
+    新成员的 restricted_until，-1 表示由机器人禁言，之后保持 ac_record.restricted_until 不变；
+    None 表示是管理员或已被踢出，无需处理
+    """
     if msg.new_chat_member.status == 'restricted':
         restricted_until = msg.new_chat_member.until_date
         if restricted_until == 0:
             restricted_until = -1  # Restricted by bot, keep ac_record.restricted_until unchanged later
+        return restricted_until
     elif msg.new_chat_member.status == 'creator' or \
             msg.new_chat_member.status == 'administrator' or \
             msg.new_chat_member.status == 'kicked':
-        return
+        return None
     else:
-        restricted_until = 0
+        return 0
+
+
+def new_member_hint_text(msg: catbot.ChatMemberUpdate) -> str:
+    if bot.config.get('mosaic_new_member_name', False):
+        masked_name = partly_mosaic_name(msg.new_chat_member.name)
+    else:
+        masked_name = html_escape(msg.new_chat_member.name)
+    return bot.config['messages']['new_member_hint'].format(tg_id=msg.new_chat_member.id, tg_name=masked_name)
+
+
+def new_member(msg: catbot.ChatMemberUpdate):
+    restricted_until = joined_restricted_until(msg)
+    if restricted_until is None:
+        return
+    bot.stats.record_join(msg.chat.id)
 
     try:
         bot.silence_chat_member(msg.chat.id, msg.new_chat_member.id)
@@ -367,12 +483,7 @@ def new_member(msg: catbot.ChatMemberUpdate):
         return
 
     with t_lock:
-        records_of_id = list(filter(lambda x: x.telegram_id == msg.from_.id, bot.ac_record))
-        if len(records_of_id) == 0:
-            ac_record = AcRecord(msg.from_.id)
-            bot.ac_record.append(ac_record)
-        else:
-            ac_record: AcRecord = records_of_id[0]
+        ac_record = bot.ac_record.get_or_create(msg.from_.id)
 
         if restricted_until != -1:
             ac_record.restricted_until = restricted_until
@@ -381,19 +492,7 @@ def new_member(msg: catbot.ChatMemberUpdate):
         lift_restriction_trial(ac_record, msg.chat.id, alert=True)
     else:
         with t_lock:
-            if bot.config.get('mosaic_new_member_name', False):
-                 masked_name = partly_mosaic_name(msg.new_chat_member.name)
-            else:
-                 masked_name = html_escape(msg.new_chat_member.name)
-
-            cur = bot.send_message(
-                msg.chat.id,
-                text=bot.config['messages']['new_member_hint'].format(
-                    tg_id=msg.new_chat_member.id,
-                    tg_name=masked_name
-                ),
-                parse_mode='HTML'
-            )
+            cur = bot.send_message(msg.chat.id, text=new_member_hint_text(msg), parse_mode='HTML')
             if 'last_welcome' in bot.record and str(msg.chat.id) in bot.record['last_welcome']:
                 last_id = bot.record['last_welcome'][str(msg.chat.id)]
                 try:
@@ -410,7 +509,6 @@ def add_whitelist_cri(msg: catbot.Message) -> bool:
     return bot.detect_command('/add_whitelist', msg) and msg.chat.id in bot.config['groups']
 
 
-@bot.msg_task(add_whitelist_cri)
 def add_whitelist(msg: catbot.Message):
     try:
         adder = bot.get_chat_member(msg.chat.id, msg.from_.id)
@@ -445,14 +543,10 @@ def add_whitelist(msg: catbot.Message):
             reason = 'whitelisted'
 
     with t_lock:
-        records_of_id = list(filter(lambda x: x.telegram_id == whitelist_id, bot.ac_record))
-        if len(records_of_id) == 0:
-            ac_record = AcRecord(whitelist_id)
-            ac_record.whitelist_reason[msg.chat.id] = reason
-            bot.ac_record.append(ac_record)
-        else:
-            ac_record: AcRecord = records_of_id[0]
-            ac_record.whitelist_reason[msg.chat.id] = reason
+        ac_record = bot.ac_record.get_or_create(whitelist_id)
+        before = bot.stats.snapshot(ac_record)
+        ac_record.whitelist_reason[msg.chat.id] = reason
+        bot.stats.update(before, ac_record)
 
     log(bot.config['messages']['add_whitelist_log'].format(
         adder=html_escape(adder.name),
@@ -473,7 +567,6 @@ def remove_whitelist_cri(msg: catbot.Message) -> bool:
     return bot.detect_command('/remove_whitelist', msg) and msg.chat.id in bot.config['groups']
 
 
-@bot.msg_task(remove_whitelist_cri)
 def remove_whitelist(msg: catbot.Message):
     try:
         remover = bot.get_chat_member(msg.chat.id, msg.from_.id)
@@ -496,8 +589,8 @@ def remove_whitelist(msg: catbot.Message):
             return
 
     with t_lock:
-        records_of_id = list(filter(lambda x: x.telegram_id == whitelist_id and x.whitelist_reason[msg.chat.id], bot.ac_record))
-        if len(records_of_id) == 0:
+        ac_record = bot.ac_record.get(whitelist_id)
+        if ac_record is None or not ac_record.whitelist_reason[msg.chat.id]:
             bot.send_message(
                 msg.chat.id,
                 text=bot.config['messages']['remove_whitelist_not_found'],
@@ -505,8 +598,9 @@ def remove_whitelist(msg: catbot.Message):
             )
             return
         else:
-            ac_record: AcRecord = records_of_id[0]
+            before = bot.stats.snapshot(ac_record)
             ac_record.whitelist_reason[msg.chat.id] = ''
+            bot.stats.update(before, ac_record)
 
     log(bot.config['messages']['remove_whitelist_log'].format(remover=html_escape(remover.name), tg_id=whitelist_id))
     bot.send_message(
@@ -523,85 +617,69 @@ def whois_cri(msg: catbot.Message) -> bool:
     return bot.detect_command('/whois', msg) and msg.chat.id in bot.config['groups']
 
 
-@bot.msg_task(whois_cri)
-def whois(msg: catbot.Message):
-    user_input_token = msg.text.split()
+def parse_whois(msg: catbot.Message) -> tuple[str, Union[int, str, list[tuple[int, str]], None]]:
+    """
+    解析 /whois 的参数，返回 (类型, 值)：prompt 需提示用法；telegram 为 Telegram ID；mw 为索引中找到的站内账户；
+    candidates 为需列出的候选站内账户 (mw_id, 用户名)；mw_name 为索引中没有、需向站点查询的用户名
+    """
     if msg.reply:
-        whois_id = msg.reply_to_message.from_.id
-        whois_mw_id = None
-    else:
-        if len(user_input_token) == 1:
-            bot.send_message(
-                msg.chat.id,
-                text=bot.config['messages']['whois_prompt'],
-                reply_to_message_id=msg.id
-            )
-            return
+        return 'telegram', msg.reply_to_message.from_.id
 
-        try:
-            whois_id = int(' '.join(user_input_token[1:]))
-            whois_mw_id = None
-        except ValueError:
-            whois_id = 0
-            whois_wm_name = '_'.join(user_input_token[1:])
-            whois_wm_name = whois_wm_name[0].upper() + whois_wm_name[1:]
-            whois_mw_id = get_mw_id(whois_wm_name)
-            if whois_mw_id is None:
-                bot.send_message(
-                    msg.chat.id,
-                    text=bot.config['messages']['whois_not_found'],
-                    reply_to_message_id=msg.id
-                )
-                return
+    user_input_token = msg.text.split()
+    if len(user_input_token) == 1:
+        return 'prompt', None
+    try:
+        return 'telegram', int(' '.join(user_input_token[1:]))
+    except ValueError:
+        pass
 
-    if whois_id == bot.id:
-        bot.send_message(
-            msg.chat.id,
-            text=bot.config['messages']['whois_self'],
-            reply_to_message_id=msg.id
-        )
-        return
+    matches = bot.mw_index.find(' '.join(user_input_token[1:]))
+    if len(matches) == 1:
+        return 'mw', matches[0][0]
+    # 前缀匹配的结果只作为候选列出，即使只有一个，以免把用户名相近的账户当作查询对象
+    candidates = matches or bot.mw_index.search_prefix(' '.join(user_input_token[1:]))
+    if candidates:
+        return 'candidates', candidates
+    whois_wm_name = '_'.join(user_input_token[1:])
+    return 'mw_name', whois_wm_name[0].upper() + whois_wm_name[1:]
 
-    with t_lock:
-        def match(x):
-            return (x.confirmed or x.whitelist_reason[msg.chat.id]) and (x.telegram_id == whois_id or x.mw_id == whois_mw_id)
-        records_of_id = list(filter(match, bot.ac_record))
-        if len(records_of_id) == 0:
-            bot.send_message(
-                msg.chat.id,
-                text=bot.config['messages']['whois_not_found'],
-                reply_to_message_id=msg.id
-            )
-            return
-        else:
-            ac_record: AcRecord = records_of_id[0]
 
-    try:
-        whois_member = bot.get_chat_member(msg.chat.id, ac_record.telegram_id)
-        if whois_member.is_bot:
-            bot.send_message(
-                msg.chat.id,
-                text=bot.config['messages']['whois_bot'],
-                reply_to_message_id=msg.id
-            )
-            return
-        name = html_escape(whois_member.name)
-    except catbot.UserNotFoundError:
-        name = bot.config['messages']['whois_tg_name_unavailable']
+def whois_candidates_text(candidates: list[tuple[int, str]]) -> str:
+    return bot.config['messages']['whois_multiple'].format(
+        names='\n'.join(html_escape(name) for _, name in candidates)
+    )
+
+
+def find_whois_record(chat_id: int, whois_id: int, whois_mw_id: Union[int, None]) -> Union[AcRecord, None]:
+    """
+    调用方需持有 t_lock
+    """
+    def match(x):
+        return (x.confirmed or x.whitelist_reason[chat_id]) and (x.telegram_id == whois_id or x.mw_id == whois_mw_id)
+    if whois_mw_id is None:
+        records_of_id = [x for x in [bot.ac_record.get(whois_id)] if x is not None and match(x)]
+    elif bot.mw_index.owner(whois_mw_id) is not None:
+        records_of_id = [x for x in [bot.ac_record.get(bot.mw_index.owner(whois_mw_id))] if x is not None and match(x)]
+    elif bot.mw_index.ready:
+        records_of_id = []
+    else:
+        records_of_id = [
+            bot.ac_record.get(data['telegram_id']) for data in bot.ac_record.iter_raw()
+            if (data['confirmed'] or whitelist_reason_of(data, chat_id)) and data['mw_id'] == whois_mw_id
+        ]
+    return records_of_id[0] if records_of_id else None
+
+
+def whois_text(ac_record: AcRecord, chat_id: int, member, wp_username: Union[str, None]) -> str:
+    """
+    member 为 None 表示无法获取 Telegram 用户信息；wp_username 仅在已验证时有值
+    """
     resp_text = bot.config['messages']['whois_head'].format(
-        name=name,
+        name=html_escape(member.name) if member is not None else bot.config['messages']['whois_tg_name_unavailable'],
         tg_id=ac_record.telegram_id
     )
 
     if ac_record.confirmed:
-        wp_username = get_mw_username(ac_record.mw_id)
-        if wp_username is None:
-            bot.send_message(
-                msg.chat.id,
-                text=bot.config['messages']['whois_not_found'],
-                reply_to_message_id=msg.id
-            )
-            return
         resp_text += bot.config['messages']['whois_has_mw'].format(
             wp_id=html_escape(wp_username),
             ctime=time.strftime('%Y-%m-%d %H:%M', time.gmtime(ac_record.confirmed_time)),
@@ -609,12 +687,56 @@ def whois(msg: catbot.Message):
         )
     else:
         resp_text += bot.config['messages']['whois_no_mw']
-    if ac_record.whitelist_reason[msg.chat.id]:
-        resp_text += bot.config['messages']['whois_whitelisted'].format(reason=ac_record.whitelist_reason[msg.chat.id])
+    if ac_record.whitelist_reason[chat_id]:
+        resp_text += bot.config['messages']['whois_whitelisted'].format(reason=ac_record.whitelist_reason[chat_id])
+    return resp_text
+
+
+def whois(msg: catbot.Message):
+    kind, value = parse_whois(msg)
+    if kind == 'prompt':
+        bot.send_message(msg.chat.id, text=bot.config['messages']['whois_prompt'], reply_to_message_id=msg.id)
+        return
+    elif kind == 'candidates':
+        bot.send_message(msg.chat.id, text=whois_candidates_text(value), reply_to_message_id=msg.id, parse_mode='HTML')
+        return
+    elif kind == 'telegram':
+        whois_id, whois_mw_id = value, None
+        if whois_id == bot.id:
+            bot.send_message(msg.chat.id, text=bot.config['messages']['whois_self'], reply_to_message_id=msg.id)
+            return
+    elif kind == 'mw':
+        whois_id, whois_mw_id = 0, value
+    else:
+        whois_id, whois_mw_id = 0, get_mw_id(value)
+        if whois_mw_id is None:
+            bot.send_message(msg.chat.id, text=bot.config['messages']['whois_not_found'], reply_to_message_id=msg.id)
+            return
+
+    with t_lock:
+        ac_record = find_whois_record(msg.chat.id, whois_id, whois_mw_id)
+    if ac_record is None:
+        bot.send_message(msg.chat.id, text=bot.config['messages']['whois_not_found'], reply_to_message_id=msg.id)
+        return
+
+    try:
+        whois_member = bot.get_chat_member(msg.chat.id, ac_record.telegram_id)
+    except catbot.UserNotFoundError:
+        whois_member = None
+    if whois_member is not None and whois_member.is_bot:
+        bot.send_message(msg.chat.id, text=bot.config['messages']['whois_bot'], reply_to_message_id=msg.id)
+        return
+
+    wp_username = None
+    if ac_record.confirmed:
+        wp_username = bot.mw_index.name(ac_record.mw_id) or get_mw_username(ac_record.mw_id)
+        if wp_username is None:
+            bot.send_message(msg.chat.id, text=bot.config['messages']['whois_not_found'], reply_to_message_id=msg.id)
+            return
 
     bot.send_message(
         msg.chat.id,
-        text=resp_text,
+        text=whois_text(ac_record, msg.chat.id, whois_member, wp_username),
         reply_to_message_id=msg.id,
         parse_mode='HTML',
         disable_web_page_preview=True
@@ -625,7 +747,6 @@ def refuse_cri(msg: catbot.Message) -> bool:
     return bot.detect_command('/refuse', msg) and msg.chat.id in bot.config['groups']
 
 
-@bot.msg_task(refuse_cri)
 def refuse(msg: catbot.Message):
     try:
         operator = bot.get_chat_member(msg.chat.id, msg.from_.id)
@@ -648,16 +769,14 @@ def refuse(msg: catbot.Message):
             return
 
     with t_lock:
-        records_of_id = list(filter(lambda x: x.telegram_id == refused_id, bot.ac_record))
-        if len(records_of_id) == 0:
-            ac_record = AcRecord(refused_id)
-            bot.ac_record.append(ac_record)
-        else:
-            ac_record: AcRecord = records_of_id[0]
-
+        ac_record = bot.ac_record.get_or_create(refused_id)
+        before = bot.stats.snapshot(ac_record)
+        if ac_record.confirmed:
+            bot.mw_index.remove(ac_record.mw_id)
         ac_record.confirmed = False
         ac_record.confirming = False
         ac_record.refused = True
+        bot.stats.update(before, ac_record)
 
     log(bot.config['messages']['refuse_log'].format(tg_id=refused_id, refuser=html_escape(operator.name)))
 
@@ -669,7 +788,6 @@ def accept_cri(msg: catbot.Message) -> bool:
     return bot.detect_command('/accept', msg) and msg.chat.id in bot.config['groups']
 
 
-@bot.msg_task(accept_cri)
 def accept(msg: catbot.Message):
     operator = bot.get_chat_member(msg.chat.id, msg.from_.id)
     if not (operator.status == 'creator' or operator.status == 'administrator'):
@@ -689,18 +807,369 @@ def accept(msg: catbot.Message):
             return
 
     with t_lock:
-        records_of_id = list(filter(lambda x: x.telegram_id == accepted_id, bot.ac_record))
-        if len(records_of_id) == 0:
-            ac_record = AcRecord(accepted_id)
-            bot.ac_record.append(ac_record)
-        else:
-            ac_record = records_of_id[0]
-
+        ac_record = bot.ac_record.get_or_create(accepted_id)
+        before = bot.stats.snapshot(ac_record)
         ac_record.refused = False
+        bot.stats.update(before, ac_record)
 
     log(bot.config['messages']['accept_log'].format(tg_id=accepted_id, acceptor=html_escape(operator.name)))
 
 
+def whitelist_in_one_pass(chat_id: int, entries: dict[int, str]) -> list[AcRecord]:
+    with t_lock:
+        updated = []
+        for tg_id, reason in entries.items():
+            ac_record = bot.ac_record.get_or_create(tg_id)
+            before = bot.stats.snapshot(ac_record)
+            ac_record.whitelist_reason[chat_id] = reason
+            bot.stats.update(before, ac_record)
+            updated.append(ac_record)
+
+    return updated
+
+
+def batch_whitelist_cri(msg: catbot.Message) -> bool:
+    return bot.detect_command('/batch_whitelist', msg) and msg.chat.id in bot.config['groups']
+
+
+def batch_whitelist(msg: catbot.Message):
+    try:
+        adder = bot.get_chat_member(msg.chat.id, msg.from_.id)
+    except catbot.UserNotFoundError:
+        return
+    if not (adder.status == 'creator' or adder.status == 'administrator'):
+        return
+
+    whitelist_ids, rest = parse_id_tokens(msg.text.split()[1:])
+    if len(whitelist_ids) == 0:
+        bot.send_message(msg.chat.id, text=bot.config['messages']['batch_prompt'], reply_to_message_id=msg.id)
+        return
+    reason = ' '.join(rest) if rest else 'whitelisted'
+
+    updated = whitelist_in_one_pass(msg.chat.id, {tg_id: reason for tg_id in whitelist_ids})
+
+    log(bot.config['messages']['batch_whitelist_log'].format(
+        adder=html_escape(adder.name),
+        count=len(updated),
+        reason=reason
+    ))
+    bot.send_message(
+        msg.chat.id,
+        text=bot.config['messages']['batch_succ'].format(
+            count=len(updated),
+            skipped=len(whitelist_ids) - len(updated)
+        ),
+        reply_to_message_id=msg.id
+    )
+
+    for ac_record in updated:
+        restriction_worker.submit(lift_restriction_trial, ac_record, msg.chat.id, raise_rate_limit=True)
+
+
+def batch_remove_whitelist_cri(msg: catbot.Message) -> bool:
+    return bot.detect_command('/batch_remove_whitelist', msg) and msg.chat.id in bot.config['groups']
+
+
+def batch_remove_whitelist(msg: catbot.Message):
+    try:
+        remover = bot.get_chat_member(msg.chat.id, msg.from_.id)
+    except catbot.UserNotFoundError:
+        return
+    if not (remover.status == 'creator' or remover.status == 'administrator'):
+        return
+
+    whitelist_ids, _ = parse_id_tokens(msg.text.split()[1:])
+    if len(whitelist_ids) == 0:
+        bot.send_message(msg.chat.id, text=bot.config['messages']['batch_prompt'], reply_to_message_id=msg.id)
+        return
+
+    with t_lock:
+        updated = []
+        for tg_id in set(whitelist_ids):
+            ac_record = bot.ac_record.get(tg_id)
+            if ac_record is None or not ac_record.whitelist_reason[msg.chat.id]:
+                continue
+            before = bot.stats.snapshot(ac_record)
+            ac_record.whitelist_reason[msg.chat.id] = ''
+            bot.stats.update(before, ac_record)
+            updated.append(ac_record)
+
+    log(bot.config['messages']['batch_remove_whitelist_log'].format(
+        remover=html_escape(remover.name),
+        count=len(updated)
+    ))
+    bot.send_message(
+        msg.chat.id,
+        text=bot.config['messages']['batch_succ'].format(
+            count=len(updated),
+            skipped=len(whitelist_ids) - len(updated)
+        ),
+        reply_to_message_id=msg.id
+    )
+
+    for ac_record in updated:
+        restriction_worker.submit(silence_trial, ac_record, msg.chat.id)
+
+
+def batch_refuse_cri(msg: catbot.Message) -> bool:
+    return bot.detect_command('/batch_refuse', msg) and msg.chat.id in bot.config['groups']
+
+
+def batch_refuse(msg: catbot.Message):
+    try:
+        operator = bot.get_chat_member(msg.chat.id, msg.from_.id)
+    except catbot.UserNotFoundError:
+        return
+    if not (operator.status == 'creator' or operator.status == 'administrator'):
+        return
+
+    refused_ids, _ = parse_id_tokens(msg.text.split()[1:])
+    if len(refused_ids) == 0:
+        bot.send_message(msg.chat.id, text=bot.config['messages']['batch_prompt'], reply_to_message_id=msg.id)
+        return
+
+    with t_lock:
+        updated = []
+        for tg_id in set(refused_ids):
+            ac_record = bot.ac_record.get_or_create(tg_id)
+            before = bot.stats.snapshot(ac_record)
+            if ac_record.confirmed:
+                bot.mw_index.remove(ac_record.mw_id)
+            ac_record.confirmed = False
+            ac_record.confirming = False
+            ac_record.refused = True
+            bot.stats.update(before, ac_record)
+            updated.append(ac_record)
+
+    log(bot.config['messages']['batch_refuse_log'].format(
+        refuser=html_escape(operator.name),
+        count=len(updated)
+    ))
+    bot.send_message(
+        msg.chat.id,
+        text=bot.config['messages']['batch_succ'].format(
+            count=len(updated),
+            skipped=len(refused_ids) - len(updated)
+        ),
+        reply_to_message_id=msg.id
+    )
+
+    for ac_record in updated:
+        for chat_id in bot.config['groups']:
+            restriction_worker.submit(silence_trial, ac_record, chat_id)
+
+
+def batch_accept_cri(msg: catbot.Message) -> bool:
+    return bot.detect_command('/batch_accept', msg) and msg.chat.id in bot.config['groups']
+
+
+def batch_accept(msg: catbot.Message):
+    try:
+        operator = bot.get_chat_member(msg.chat.id, msg.from_.id)
+    except catbot.UserNotFoundError:
+        return
+    if not (operator.status == 'creator' or operator.status == 'administrator'):
+        return
+
+    accepted_ids, _ = parse_id_tokens(msg.text.split()[1:])
+    if len(accepted_ids) == 0:
+        bot.send_message(msg.chat.id, text=bot.config['messages']['batch_prompt'], reply_to_message_id=msg.id)
+        return
+
+    unique_ids = set(accepted_ids)
+    with t_lock:
+        for tg_id in unique_ids:
+            ac_record = bot.ac_record.get_or_create(tg_id)
+            before = bot.stats.snapshot(ac_record)
+            ac_record.refused = False
+            bot.stats.update(before, ac_record)
+
+    log(bot.config['messages']['batch_accept_log'].format(
+        acceptor=html_escape(operator.name),
+        count=len(unique_ids)
+    ))
+    bot.send_message(
+        msg.chat.id,
+        text=bot.config['messages']['batch_succ'].format(
+            count=len(unique_ids),
+            skipped=len(accepted_ids) - len(unique_ids)
+        ),
+        reply_to_message_id=msg.id
+    )
+
+
+def export_whitelist_cri(msg: catbot.Message) -> bool:
+    return bot.detect_command('/export_whitelist', msg) and msg.chat.id in bot.config['groups']
+
+
+def export_whitelist(msg: catbot.Message):
+    try:
+        operator = bot.get_chat_member(msg.chat.id, msg.from_.id)
+    except catbot.UserNotFoundError:
+        return
+    if not (operator.status == 'creator' or operator.status == 'administrator'):
+        return
+
+    user_input_token = msg.text.split()
+    file_format = user_input_token[1].lower() if len(user_input_token) > 1 else 'csv'
+
+    with t_lock:
+        ac_records = bot.ac_record.snapshot()
+    whitelist = []
+    for data in ac_records.iter_raw():
+        reason = whitelist_reason_of(data, msg.chat.id)
+        if reason:
+            whitelist.append((data['telegram_id'], reason))
+
+    if file_format == 'json':
+        content = json.dumps({
+            'chat_id': msg.chat.id,
+            'whitelist': [{'telegram_id': tg_id, 'reason': reason} for tg_id, reason in whitelist]
+        }, ensure_ascii=False, indent=2).encode('utf-8')
+    else:
+        file_format = 'csv'
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(['telegram_id', 'reason'])
+        writer.writerows(whitelist)
+        content = buffer.getvalue().encode('utf-8')
+
+    send_document(
+        msg.chat.id,
+        f'whitelist_{msg.chat.id}.{file_format}',
+        content,
+        caption=bot.config['messages']['export_whitelist_caption'].format(count=len(whitelist)),
+        reply_to_message_id=msg.id
+    )
+
+
+def import_whitelist_cri(msg: catbot.Message) -> bool:
+    return bot.detect_command('/import_whitelist', msg) and msg.chat.id in bot.config['groups']
+
+
+def import_whitelist(msg: catbot.Message):
+    try:
+        adder = bot.get_chat_member(msg.chat.id, msg.from_.id)
+    except catbot.UserNotFoundError:
+        return
+    if not (adder.status == 'creator' or adder.status == 'administrator'):
+        return
+
+    if not msg.reply or 'document' not in msg.reply_to_message.raw:
+        bot.send_message(msg.chat.id, text=bot.config['messages']['import_whitelist_prompt'], reply_to_message_id=msg.id)
+        return
+
+    user_input_token = msg.text.split()
+    reason = ' '.join(user_input_token[1:]) if len(user_input_token) > 1 else 'whitelisted'
+    try:
+        content = download_document(msg.reply_to_message.raw['document']['file_id'])
+        entries, skipped = parse_whitelist_file(content, reason)
+    except (catbot.APIError, requests.RequestException, UnicodeDecodeError, ValueError, KeyError, TypeError):
+        bot.send_message(msg.chat.id, text=bot.config['messages']['import_whitelist_error'], reply_to_message_id=msg.id)
+        return
+
+    updated = whitelist_in_one_pass(msg.chat.id, entries)
+
+    log(bot.config['messages']['import_whitelist_log'].format(
+        adder=html_escape(adder.name),
+        count=len(updated),
+        filename=html_escape(msg.reply_to_message.raw['document'].get('file_name', '')),
+        reason=reason
+    ))
+    bot.send_message(
+        msg.chat.id,
+        text=bot.config['messages']['batch_succ'].format(count=len(updated), skipped=skipped),
+        reply_to_message_id=msg.id
+    )
+
+    for ac_record in updated:
+        restriction_worker.submit(lift_restriction_trial, ac_record, msg.chat.id, raise_rate_limit=True)
+
+
+def profile_cri(msg: catbot.Message) -> bool:
+    if not bot.detect_command('/profile', msg):
+        return False
+    elif msg.chat.id == bot.config['log_channel']:
+        return True
+    else:
+        return msg.chat.type == 'private' and msg.from_.id in bot.config.get('admins', [])
+
+
+def profile(msg: catbot.Message):
+    user_input_token = msg.text.split()
+    try:
+        duration = min(float(user_input_token[1]), 300) if len(user_input_token) > 1 else 10
+    except ValueError:
+        bot.send_message(msg.chat.id, text=bot.config['messages']['profile_prompt'], reply_to_message_id=msg.id)
+        return
+
+    bot.send_message(msg.chat.id, text=bot.config['messages']['profile_start'].format(seconds=duration))
+    try:
+        report = profiler.run(duration)
+    except RuntimeError:
+        bot.send_message(msg.chat.id, text=bot.config['messages']['profile_running'], reply_to_message_id=msg.id)
+        return
+
+    send_document(
+        msg.chat.id,
+        f'profile_{time.strftime("%Y%m%d_%H%M%S", time.gmtime())}.txt',
+        report.encode('utf-8'),
+        reply_to_message_id=msg.id
+    )
+
+
+def stats_cri(msg: catbot.Message) -> bool:
+    return bot.detect_command('/stats', msg) and \
+        (msg.chat.id in bot.config['groups'] or msg.chat.id == bot.config['log_channel'])
+
+
+def show_stats(msg: catbot.Message):
+    if msg.chat.id in bot.config['groups']:
+        try:
+            operator = bot.get_chat_member(msg.chat.id, msg.from_.id)
+        except catbot.UserNotFoundError:
+            return
+        if not (operator.status == 'creator' or operator.status == 'administrator'):
+            return
+        chat_ids = [msg.chat.id]
+        scope = bot.config['messages']['stats_scope_group']
+    else:
+        chat_ids = bot.config['groups']
+        scope = bot.config['messages']['stats_scope_all']
+
+    user_input_token = msg.text.split()
+    try:
+        days = int(user_input_token[1]) if len(user_input_token) > 1 else 7
+    except ValueError:
+        bot.send_message(msg.chat.id, text=bot.config['messages']['stats_prompt'], reply_to_message_id=msg.id)
+        return
+    days = max(1, min(days, bot.stats.history_days))
+
+    history = [
+        bot.config['messages']['stats_history_line'].format(
+            date=day,
+            confirm=events['confirm'],
+            deconfirm=events['deconfirm'],
+            join=sum(events[f'join {chat_id}'] for chat_id in chat_ids)
+        )
+        for day, events in bot.stats.recent(days)
+    ]
+    bot.send_message(
+        msg.chat.id,
+        text=bot.config['messages']['stats_report'].format(
+            confirmed=bot.stats.confirmed,
+            confirming=bot.stats.confirming,
+            refused=bot.stats.refused,
+            whitelisted=sum(bot.stats.whitelisted[chat_id] for chat_id in chat_ids),
+            scope=scope,
+            days=days,
+            history='\n'.join(history)
+        ),
+        reply_to_message_id=msg.id,
+        parse_mode='HTML'
+    )
+
+
 def block_unconfirmed_cri(msg: catbot.Message) -> bool:
     if msg.chat.id not in bot.config['groups']:
         return False
@@ -712,13 +1181,10 @@ def block_unconfirmed_cri(msg: catbot.Message) -> bool:
         return True
 
 
-# @bot.msg_task(block_unconfirmed_cri)
 def block_unconfirmed(msg: catbot.Message):
     with t_lock:
-        def match(x):
-            return x.telegram_id == msg.from_.id and (x.confirmed or x.whitelist_reason[msg.chat.id])
-        records_of_id = list(filter(match, bot.ac_record))
-        if len(records_of_id) > 0:
+        ac_record = bot.ac_record.get(msg.from_.id)
+        if ac_record is not None and (ac_record.confirmed or ac_record.whitelist_reason[msg.chat.id]):
             return
 
     try:
@@ -731,7 +1197,6 @@ def enable_cri(msg: catbot.Message):
     return bot.detect_command('/enable', msg, require_username=True) and msg.chat.type != 'private'
 
 
-@bot.msg_task(enable_cri)
 def enable(msg: catbot.Message):
     try:
         adder = bot.get_chat_member(msg.chat.id, msg.from_.id)
@@ -759,7 +1224,6 @@ def disable_cri(msg: catbot.Message):
     return bot.detect_command('/disable', msg, require_username=True) and msg.chat.type != 'private'
 
 
-@bot.msg_task(disable_cri)
 def disable(msg: catbot.Message):
     try:
         adder = bot.get_chat_member(msg.chat.id, msg.from_.id)
@@ -781,6 +1245,320 @@ def disable(msg: catbot.Message):
     ))
 
 
+# 以下为 async_mode 下使用的协程版本，aio_clients 与 a_lock 在启动时赋值
+aio_clients = None
+a_lock = None
+
+
+async def async_log(text):
+    await aio_clients.telegram.send_message(bot.config['log_channel'], text=text, parse_mode='HTML',
+                                            disable_web_page_preview=True)
+
+
+async def async_silence_trial(ac_record: AcRecord, chat_id: int, alert=False):
+    try:
+        member = await aio_clients.telegram.get_chat_member(chat_id, ac_record.telegram_id)
+    except catbot.UserNotFoundError:
+        return
+    if member.status == 'kicked' or ac_record.confirmed or ac_record.whitelist_reason[chat_id]:
+        return
+    try:
+        await aio_clients.telegram.silence_chat_member(chat_id, ac_record.telegram_id)
+        text = restriction_alert('silence_alert', member, ac_record) if alert else None
+    except catbot.APIError as e:
+        text = restriction_failure(e, alert)
+    if text:
+        await aio_clients.telegram.send_message(chat_id, text=text, parse_mode='HTML')
+
+
+async def async_lift_restriction_trial(ac_record: AcRecord, chat_id: int, alert=False):
+    try:
+        member = await aio_clients.telegram.get_chat_member(chat_id, ac_record.telegram_id)
+    except catbot.UserNotFoundError:
+        return
+    if member.status == 'kicked':
+        return
+    try:
+        await aio_clients.telegram.lift_restrictions(chat_id, ac_record.telegram_id)
+        text = restriction_alert('lift_restriction_alert', member, ac_record) if alert else None
+    except catbot.APIError as e:
+        text = restriction_failure(e, alert, ignore_other=True)
+    if text:
+        await aio_clients.telegram.send_message(chat_id, text=text, parse_mode='HTML')
+
+
+async def async_get_global_user_info(mw_id: int) -> dict:
+    return await aio_clients.mediawiki.api(**global_user_info_params(guiid=mw_id, guiprop='merged'))
+
+
+async def async_check_eligibility(query: catbot.CallbackQuery, mw_id: int) -> bool:
+    await aio_clients.telegram.send_message(query.msg.chat.id, text=bot.config['messages']['confirm_checking'])
+    result = await eligibility.check_async(mw_id, async_get_global_user_info)
+    text = eligibility_reply(result)
+    if text:
+        await aio_clients.telegram.send_message(query.msg.chat.id, text=text)
+    return result.eligible
+
+
+async def async_get_mw_username(mw_id: int) -> Union[str, None]:
+    return parse_mw_username(mw_id, await aio_clients.mediawiki.api(**global_user_info_params(guiid=mw_id)))
+
+
+async def async_get_mw_id(mw_username: str) -> Union[int, None]:
+    return parse_mw_id(await aio_clients.mediawiki.api(**global_user_info_params(guiuser=mw_username)))
+
+
+async def async_confirm_button(query: catbot.CallbackQuery):
+    await aio_clients.telegram.answer_callback_query(query.id)
+    await aio_clients.telegram.edit_message(query.msg.chat.id, query.msg.id, text=query.msg.html_formatted_text,
+                                            parse_mode='HTML', disable_web_page_preview=True)
+    # 网络请求期间不持有 t_lock。先清除 confirming 占用本次验证，重复点击会得到 confirm_session_lost
+    async with a_lock:
+        ac_record = bot.ac_record.get(query.from_.id)
+        if ac_record is None or not (ac_record.confirmed or ac_record.confirming):
+            state = 'session_lost'
+        elif ac_record.confirmed:
+            state = 'already'
+        else:
+            state = 'checking'
+            before = bot.stats.snapshot(ac_record)
+            ac_record.confirming = False
+            bot.stats.update(before, ac_record)
+
+    if state == 'session_lost':
+        await aio_clients.telegram.send_message(query.msg.chat.id, text=bot.config['messages']['confirm_session_lost'])
+        return
+    elif state == 'already':
+        await aio_clients.telegram.send_message(query.msg.chat.id, text=bot.config['messages']['confirm_already'].format(
+            wp_name=await async_get_mw_username(ac_record.mw_id)
+        ))
+        return
+
+    confirmed = False
+    res = await aio_clients.post_json(bot.config['oauth_query_url'], {
+        'query_key': bot.config['oauth_query_key'],
+        'telegram_id': str(query.from_.id)
+    })
+    if res is not None and res['ok']:
+        mw_id: int = res['mw_id']
+        async with a_lock:
+            ac_record.mw_id = mw_id
+            same_mw_id_record = find_confirmed_by_mw_id(mw_id)
+        if len(same_mw_id_record) >= 1:
+            await aio_clients.telegram.send_message(
+                query.msg.chat.id,
+                text=bot.config['messages']['confirm_other_tg'].format(wp_name=await async_get_mw_username(mw_id))
+            )
+        elif await async_check_eligibility(query, mw_id):
+            async with a_lock:
+                # 检查期间可能有其他 Telegram 账户验证了同一站内账户
+                if len(find_confirmed_by_mw_id(mw_id)) == 0:
+                    before = bot.stats.snapshot(ac_record)
+                    confirmed = True
+                    ac_record.confirmed = True
+                    ac_record.confirmed_time = time.time()
+                    bot.mw_index.add(ac_record.mw_id, ac_record.telegram_id)
+                    bot.stats.update(before, ac_record)
+
+    if confirmed:
+        await aio_clients.telegram.send_message(query.msg.chat.id, text=bot.config['messages']['confirm_complete'])
+        await asyncio.gather(*[
+            async_lift_restriction_trial(ac_record, chat_id, alert=True) for chat_id in bot.config['groups']
+        ])
+        await async_log(bot.config['messages']['confirm_log'].format(
+            tg_id=ac_record.telegram_id,
+            wp_name=await async_get_mw_username(ac_record.mw_id),
+            site=bot.config['main_site']
+        ))
+    else:
+        await aio_clients.telegram.send_message(query.msg.chat.id, text=bot.config['messages']['confirm_failed'],
+                                                parse_mode='HTML')
+
+
+async def async_new_member(msg: catbot.ChatMemberUpdate):
+    restricted_until = joined_restricted_until(msg)
+    if restricted_until is None:
+        return
+    bot.stats.record_join(msg.chat.id)
+
+    try:
+        await aio_clients.telegram.silence_chat_member(msg.chat.id, msg.new_chat_member.id)
+        if match_blacklist(msg.new_chat_member.name):
+            await aio_clients.telegram.kick_chat_member(msg.chat.id, msg.new_chat_member.id)
+            return
+    except catbot.InsufficientRightError:
+        await aio_clients.telegram.send_message(msg.chat.id, text=bot.config['messages']['insufficient_right'])
+        return
+
+    async with a_lock:
+        ac_record = bot.ac_record.get_or_create(msg.from_.id)
+
+        if restricted_until != -1:
+            ac_record.restricted_until = restricted_until
+
+    if ac_record.confirmed or ac_record.whitelist_reason[msg.chat.id]:
+        await async_lift_restriction_trial(ac_record, msg.chat.id, alert=True)
+        return
+
+    cur = await aio_clients.telegram.send_message(msg.chat.id, text=new_member_hint_text(msg), parse_mode='HTML')
+    async with a_lock:
+        last_welcome = bot.record.setdefault('last_welcome', {})
+        last_id = last_welcome.get(str(msg.chat.id))
+        last_welcome[str(msg.chat.id)] = cur['message_id']
+    if last_id is not None:
+        try:
+            await aio_clients.telegram.delete_message(msg.chat.id, last_id)
+        except catbot.DeleteMessageError:
+            pass
+
+
+async def async_whois(msg: catbot.Message):
+    kind, value = parse_whois(msg)
+    if kind == 'prompt':
+        await aio_clients.telegram.send_message(
+            msg.chat.id,
+            text=bot.config['messages']['whois_prompt'],
+            reply_to_message_id=msg.id
+        )
+        return
+    elif kind == 'candidates':
+        await aio_clients.telegram.send_message(
+            msg.chat.id,
+            text=whois_candidates_text(value),
+            reply_to_message_id=msg.id,
+            parse_mode='HTML'
+        )
+        return
+    elif kind == 'telegram':
+        whois_id, whois_mw_id = value, None
+        if whois_id == bot.id:
+            await aio_clients.telegram.send_message(
+                msg.chat.id,
+                text=bot.config['messages']['whois_self'],
+                reply_to_message_id=msg.id
+            )
+            return
+    elif kind == 'mw':
+        whois_id, whois_mw_id = 0, value
+    else:
+        whois_id, whois_mw_id = 0, await async_get_mw_id(value)
+        if whois_mw_id is None:
+            await aio_clients.telegram.send_message(
+                msg.chat.id,
+                text=bot.config['messages']['whois_not_found'],
+                reply_to_message_id=msg.id
+            )
+            return
+
+    async with a_lock:
+        ac_record = find_whois_record(msg.chat.id, whois_id, whois_mw_id)
+    if ac_record is None:
+        await aio_clients.telegram.send_message(
+            msg.chat.id,
+            text=bot.config['messages']['whois_not_found'],
+            reply_to_message_id=msg.id
+        )
+        return
+
+    try:
+        whois_member = await aio_clients.telegram.get_chat_member(msg.chat.id, ac_record.telegram_id)
+    except catbot.UserNotFoundError:
+        whois_member = None
+    if whois_member is not None and whois_member.is_bot:
+        await aio_clients.telegram.send_message(
+            msg.chat.id,
+            text=bot.config['messages']['whois_bot'],
+            reply_to_message_id=msg.id
+        )
+        return
+
+    wp_username = None
+    if ac_record.confirmed:
+        wp_username = bot.mw_index.name(ac_record.mw_id) or await async_get_mw_username(ac_record.mw_id)
+        if wp_username is None:
+            await aio_clients.telegram.send_message(
+                msg.chat.id,
+                text=bot.config['messages']['whois_not_found'],
+                reply_to_message_id=msg.id
+            )
+            return
+
+    await aio_clients.telegram.send_message(
+        msg.chat.id,
+        text=whois_text(ac_record, msg.chat.id, whois_member, wp_username),
+        reply_to_message_id=msg.id,
+        parse_mode='HTML',
+        disable_web_page_preview=True
+    )
+
+
+def task_table(use_async: bool) -> dict[str, list[tuple]]:
+    """
+    所有任务的 (criteria, handler)，按更新类型分组并按匹配顺序排列。同步模式下注册到 catbot，
+    async_mode 与回放也使用这张表。use_async 为 True 时 confirm_button、new_member、whois 换成协程版本
+    """
+    return {
+        'message': [
+            (start_cri, start),
+            (policy_cri, policy),
+            (confirm_cri, confirm),
+            (deconfirm_cri, deconfirm),
+            (add_whitelist_cri, add_whitelist),
+            (remove_whitelist_cri, remove_whitelist),
+            (whois_cri, async_whois if use_async else whois),
+            (refuse_cri, refuse),
+            (accept_cri, accept),
+            (batch_whitelist_cri, batch_whitelist),
+            (batch_remove_whitelist_cri, batch_remove_whitelist),
+            (batch_refuse_cri, batch_refuse),
+            (batch_accept_cri, batch_accept),
+            (export_whitelist_cri, export_whitelist),
+            (import_whitelist_cri, import_whitelist),
+            (profile_cri, profile),
+            (stats_cri, show_stats),
+            (enable_cri, enable),
+            (disable_cri, disable),
+            # (block_unconfirmed_cri, block_unconfirmed),
+        ],
+        'callback_query': [
+            (confirm_button_cri, async_confirm_button if use_async else confirm_button),
+            (deconfirm_button_cri, deconfirm_button),
+        ],
+        'chat_member': [
+            (new_member_cri, async_new_member if use_async else new_member),
+        ],
+    }
+
+
+task_registrars = {
+    'message': bot.msg_task,
+    'callback_query': bot.query_task,
+    'chat_member': bot.member_status_task,
+}
+for update_type, tasks in task_table(use_async=False).items():
+    for criteria, handler in tasks:
+        task_registrars[update_type](criteria)(handler)
+
+
 if __name__ == '__main__':
+    bot.mw_index.start_refresh(
+        confirmed_mw_ids,
+        get_mw_username,
+        bot.config.get('mw_index_refresh_interval', 3600),
+        fetch_rate=bot.config.get('mw_index_fetch_rate', 5)
+    )
     with bot:
-        bot.start()
+        if bot.config.get('async_mode', False):
+            import aio
+
+            aio_clients = aio.AsyncClients(bot.config)
+            a_lock = aio.ThreadLockAdapter(t_lock)
+            aio.AsyncRunner(
+                aio_clients,
+                task_table(use_async=True),
+                max_inflight=bot.config.get('async_max_inflight', 1000),
+                max_workers=bot.config.get('async_max_workers', 16),
+                recorder=bot.recorder
+            ).start()
+        else:
+            bot.start()
@@ -0,0 +1,159 @@
+import bisect
+import threading
+import time
+from typing import Callable, Iterable, Union
+
+
+def normalize_username(name: str) -> str:
+    """
+    按 MediaWiki 的规则规范化用户名：下划线视为空格，合并多余空白，首字母大写
+    """
+    name = ' '.join(name.replace('_', ' ').split())
+    return name[:1].upper() + name[1:]
+
+
+class MwUsernameIndex:
+    """
+    已验证的站内账户索引：mw_id -> (telegram_id, 站内用户名)
+    支持按用户名精确、忽略大小写及前缀查找，供 /whois 在内存中直接作答。
+    由后台线程定期与验证记录同步，并补全缺少的用户名
+    """
+    def __init__(self, data: Union[dict, None] = None):
+        self._owners: dict[int, int] = {}
+        self._names: dict[int, str] = {}
+        self._by_folded: dict[str, set[int]] = {}
+        self._sorted_folded: list[str] = []
+        self._touched: Union[set[int], None] = None
+        self._lock = threading.Lock()
+        self.ready = False
+        """
+        首次同步完成前，索引中可能缺少部分账户
+        """
+        if data:
+            for key, (telegram_id, name) in data.items():
+                self._owners[int(key)] = telegram_id
+                if name:
+                    self._insert_name(int(key), name)
+
+    def dump(self) -> dict:
+        with self._lock:
+            return {str(mw_id): [telegram_id, self._names.get(mw_id)] for mw_id, telegram_id in self._owners.items()}
+
+    def add(self, mw_id: int, telegram_id: int, name: Union[str, None] = None):
+        with self._lock:
+            self._owners[mw_id] = telegram_id
+            if name:
+                self._insert_name(mw_id, name)
+            if self._touched is not None:
+                self._touched.add(mw_id)
+
+    def set_name(self, mw_id: int, name: str):
+        """
+        更新已索引账户的用户名（例如账户已更名），未验证的账户会被忽略
+        """
+        with self._lock:
+            if mw_id in self._owners and self._names.get(mw_id) != name:
+                self._insert_name(mw_id, name)
+
+    def remove(self, mw_id: int):
+        with self._lock:
+            self._owners.pop(mw_id, None)
+            self._remove_name(mw_id)
+            if self._touched is not None:
+                self._touched.add(mw_id)
+
+    def owner(self, mw_id: int) -> Union[int, None]:
+        return self._owners.get(mw_id)
+
+    def name(self, mw_id: int) -> Union[str, None]:
+        return self._names.get(mw_id)
+
+    def find(self, query: str) -> list[tuple[int, str]]:
+        """
+        按用户名查找，返回 (mw_id, 用户名)：有完全相同的用户名时只返回它，否则返回忽略大小写后相同的所有账户。
+        用户名与 mw_id 在同一次加锁中取出，不受之后的更名或移除影响
+        """
+        name = normalize_username(query)
+        with self._lock:
+            candidates = [(mw_id, self._names[mw_id]) for mw_id in self._by_folded.get(name.casefold(), ())]
+            exact = [x for x in candidates if x[1] == name]
+            if exact:
+                return exact
+            return sorted(candidates, key=lambda x: x[1])
+
+    def search_prefix(self, query: str, limit: int = 10) -> list[tuple[int, str]]:
+        """
+        忽略大小写的前缀查找，返回 (mw_id, 用户名)，只用于列出候选账户
+        """
+        folded = normalize_username(query).casefold()
+        with self._lock:
+            result = []
+            i = bisect.bisect_left(self._sorted_folded, folded)
+            while i < len(self._sorted_folded) and self._sorted_folded[i].startswith(folded) and len(result) < limit:
+                result.extend(sorted(((x, self._names[x]) for x in self._by_folded[self._sorted_folded[i]]),
+                                     key=lambda x: x[1]))
+                i += 1
+            return result[:limit]
+
+    def refresh(self, load_confirmed: Callable[[], Iterable[tuple[int, int]]],
+                fetch_name: Callable[[int], Union[str, None]], fetch_rate: float = 5):
+        """
+        与验证记录同步：load_confirmed 给出所有已验证的 (mw_id, telegram_id)，
+        然后对缺少用户名的账户调用 fetch_name 补全，每秒不超过 fetch_rate 次。
+        同步期间由 add/remove 改动过的账户以改动为准
+        """
+        with self._lock:
+            self._touched = set()
+        owners = dict(load_confirmed())
+
+        with self._lock:
+            for mw_id in list(self._owners):
+                if mw_id not in owners and mw_id not in self._touched:
+                    self._owners.pop(mw_id)
+                    self._remove_name(mw_id)
+            for mw_id, telegram_id in owners.items():
+                if mw_id not in self._touched:
+                    self._owners[mw_id] = telegram_id
+            self._touched = None
+            missing = [mw_id for mw_id in self._owners if mw_id not in self._names]
+        self.ready = True
+
+        for i, mw_id in enumerate(missing):
+            if i > 0:
+                time.sleep(1 / fetch_rate)
+            if mw_id not in self._owners or mw_id in self._names:
+                continue
+            name = fetch_name(mw_id)
+            if name:
+                self.set_name(mw_id, name)
+
+    def start_refresh(self, load_confirmed: Callable[[], Iterable[tuple[int, int]]],
+                      fetch_name: Callable[[int], Union[str, None]], interval: float, fetch_rate: float = 5):
+        def loop():
+            while True:
+                try:
+                    self.refresh(load_confirmed, fetch_name, fetch_rate)
+                except Exception as e:
+                    print(f'[Error] Refresh username index failed: {e}')
+                time.sleep(interval)
+
+        threading.Thread(target=loop, name='MwUsernameIndex', daemon=True).start()
+
+    def _insert_name(self, mw_id: int, name: str):
+        self._remove_name(mw_id)
+        self._names[mw_id] = name
+        folded = name.casefold()
+        if folded not in self._by_folded:
+            self._by_folded[folded] = set()
+            bisect.insort(self._sorted_folded, folded)
+        self._by_folded[folded].add(mw_id)
+
+    def _remove_name(self, mw_id: int):
+        name = self._names.pop(mw_id, None)
+        if name is None:
+            return
+        folded = name.casefold()
+        self._by_folded[folded].discard(mw_id)
+        if not self._by_folded[folded]:
+            del self._by_folded[folded]
+            del self._sorted_folded[bisect.bisect_left(self._sorted_folded, folded)]
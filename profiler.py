@@ -0,0 +1,151 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Union
+
+CATEGORIES = [
+    ('site.api (mwclient)', ('mwclient',)),
+    ('catbot', ('catbot',)),
+    ('network', ('requests', 'urllib3', 'http', 'ssl', 'socket')),
+]
+
+
+class ContendedLock:
+    """
+    threading.Lock 的包装，记录正在等待该锁的线程，供 SamplingProfiler 标注锁等待
+    未发生争用时只多一次非阻塞的 acquire
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self.waiting: set[int] = set()
+        self._lock = threading.Lock()
+
+    def acquire(self, blocking=True, timeout=-1) -> bool:
+        if self._lock.acquire(False):
+            return True
+        if not blocking:
+            return False
+        ident = threading.get_ident()
+        self.waiting.add(ident)
+        try:
+            return self._lock.acquire(True, timeout)
+        finally:
+            self.waiting.discard(ident)
+
+    def release(self):
+        self._lock.release()
+
+    def locked(self) -> bool:
+        return self._lock.locked()
+
+    def __enter__(self):
+        self.acquire()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+
+class SamplingProfiler:
+    """
+    定时读取 sys._current_frames() 采样处理线程的调用栈，不开启时没有任何开销
+    只统计调用栈中含有 handler_file（即 main.py）中函数的线程，轮询、后台同步等空闲线程会被忽略
+    """
+    def __init__(self, handler_file: str, locks: list[ContendedLock] = (), interval: float = 0.005):
+        self.handler_file = os.path.abspath(handler_file)
+        self.locks = list(locks)
+        self.interval = interval
+        self._running = threading.Lock()
+
+    def run(self, duration: float) -> str:
+        """
+        阻塞采样 duration 秒并返回文本报告；已有采样进行中时抛出 RuntimeError
+        """
+        if not self._running.acquire(False):
+            raise RuntimeError('Profiler is already running')
+        try:
+            stacks, samples, threads = self._sample(duration)
+        finally:
+            self._running.release()
+        return self._report(stacks, samples, threads, duration)
+
+    def _sample(self, duration: float):
+        stacks: Counter[tuple[str, ...]] = Counter()
+        samples = 0
+        threads = set()
+        own = threading.get_ident()
+        end = time.monotonic() + duration
+        while time.monotonic() < end:
+            waiting = {ident: lock.name for lock in self.locks for ident in list(lock.waiting)}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = self._walk(frame)
+                if stack is None:
+                    continue
+                if ident in waiting:
+                    stack += (f'[lock wait: {waiting[ident]}]',)
+                stacks[stack] += 1
+                threads.add(ident)
+            samples += 1
+            time.sleep(self.interval)
+        return stacks, samples, threads
+
+    def _walk(self, frame) -> Union[tuple[str, ...], None]:
+        labels = []
+        in_handler = False
+        while frame is not None:
+            code = frame.f_code
+            if code.co_filename == self.handler_file:
+                module = 'main'
+                if code.co_name != '<module>':
+                    in_handler = True
+            else:
+                module = frame.f_globals.get('__name__', os.path.basename(code.co_filename))
+            labels.append(f'{module}:{code.co_qualname}')
+            frame = frame.f_back
+        if not in_handler:
+            return None
+        return tuple(reversed(labels))
+
+    @staticmethod
+    def _report(stacks: Counter, samples: int, threads: set, duration: float) -> str:
+        total = sum(stacks.values())
+        if total == 0:
+            return f'Profile: {duration:.1f} s, {samples} samples, no handler thread was running.\n'
+
+        categories = Counter()
+        handlers = Counter()
+        hot = Counter()
+        for stack, count in stacks.items():
+            modules = {label.split(':', 1)[0] for label in stack}
+            for name, prefixes in CATEGORIES:
+                if any(m.split('.', 1)[0] in prefixes for m in modules):
+                    categories[name] += count
+            if stack[-1].startswith('[lock wait'):
+                categories[stack[-1][1:-1]] += count
+            hot[stack[-1]] += count
+            for label in set(stack):
+                if label.startswith('main:') and not label.endswith('<module>'):
+                    handlers[label[len('main:'):]] += count
+
+        def table(counter: Counter, limit: int = 20) -> list[str]:
+            return [f'{count / total:7.1%} {count:7d}  {label}' for label, count in counter.most_common(limit)]
+
+        lines = [
+            f'Profile: {duration:.1f} s, {samples} samples, {total} thread samples from {len(threads)} handler threads',
+            '',
+            '== Categories (inclusive) ==',
+            *table(categories),
+            '',
+            '== main.py functions (inclusive) ==',
+            *table(handlers),
+            '',
+            '== Hot frames (self) ==',
+            *table(hot),
+            '',
+            '== Collapsed stacks (flamegraph.pl / speedscope) ==',
+            *[f'{";".join(stack)} {count}' for stack, count in stacks.most_common()],
+        ]
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,77 @@
+import queue
+import re
+import threading
+import time
+
+_retry_after_re = re.compile(r'retry after (\d+)')
+
+
+def is_rate_limited(e: Exception) -> bool:
+    """
+    Telegram 返回 429 时错误信息中带有 retry after，RateLimitedWorker 会据此重试
+    """
+    return _retry_after_re.search(str(e)) is not None
+
+
+class RateLimitedWorker:
+    """
+    在后台线程中依次执行任务，按令牌桶限速
+    用于批量禁言、解除禁言等需要大量调用 Telegram API 的操作
+    """
+    def __init__(self, rate: float, burst: int = 1, max_retries: int = 3):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.max_retries = max_retries
+        self._tokens: float = self.burst
+        self._last_refill = time.monotonic()
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: threading.Thread | None = None
+        self._start_lock = threading.Lock()
+
+    def submit(self, func, *args, **kwargs):
+        self._queue.put((func, args, kwargs))
+        self._ensure_started()
+
+    def join(self):
+        """
+        阻塞至队列中所有任务执行完毕
+        """
+        self._queue.join()
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def _ensure_started(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='RateLimitedWorker', daemon=True)
+                self._thread.start()
+
+    def _acquire(self):
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate)
+            self._last_refill = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            time.sleep((1 - self._tokens) / self.rate)
+
+    def _run(self):
+        while True:
+            func, args, kwargs = self._queue.get()
+            try:
+                for attempt in range(self.max_retries + 1):
+                    self._acquire()
+                    try:
+                        func(*args, **kwargs)
+                        break
+                    except Exception as e:
+                        # Telegram 返回 429 时按其要求的时间等待后重试
+                        retry_after = _retry_after_re.search(str(e))
+                        if retry_after is None or attempt == self.max_retries:
+                            print(f'[Error] {getattr(func, "__name__", func)}{args}: {e}')
+                            break
+                        time.sleep(int(retry_after.group(1)))
+            finally:
+                self._queue.task_done()
@@ -0,0 +1,435 @@
+"""
+更新录制与回放
+
+录制：在 config 中设置 update_record，例如 {"path": "updates.jsonl.gz", "anonymize": true}，
+机器人会把收到的 Message、CallbackQuery、ChatMemberUpdate 连同时间写入 gzip 压缩的 JSON Lines 文件。
+每次启动写入新文件，文件名中加入启动时间，例如 updates-20240101-120000.jsonl.gz。
+anonymize 为 true 时，用户与群组 ID（包括指令文本中的数字 ID）会被替换为带密钥哈希后的 ID，同一个文件中保持一致。
+
+回放：python replay.py updates-20240101-120000.jsonl.gz --config config.json [--speed max] [--async]
+在临时目录中用录制时的更新驱动 main.py 中的 handler，Telegram、MediaWiki 与 OAuth 均为本地桩，
+最后输出吞吐量与各 handler 的延迟分位数，可用 --json 保存结果以比较不同版本
+"""
+import argparse
+import atexit
+import gzip
+import hashlib
+import hmac
+import json
+import os
+import re
+import secrets
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from typing import Union
+
+UPDATE_TYPES = ('message', 'callback_query', 'chat_member')
+_id_keys = {'id', 'user_id', 'chat_id'}
+_text_id_re = re.compile(r'-?\d{5,}')
+
+
+def run_path(path: str, start: float) -> str:
+    """
+    在文件名（.jsonl.gz 等扩展名之前）加入启动时间
+    """
+    directory, name = os.path.split(path)
+    stem, ext = name, ''
+    for suffix in ('.jsonl.gz', '.json.gz', '.gz'):
+        if name.endswith(suffix):
+            stem, ext = name[:-len(suffix)], suffix
+            break
+    return os.path.join(directory, f'{stem}-{time.strftime("%Y%m%d-%H%M%S", time.localtime(start))}{ext}')
+
+
+class UpdateRecorder:
+    """
+    每个实例写入一个新文件（路径见 run_path），文件的第一行为文件头，之后每行一个更新
+    """
+    def __init__(self, path: str, anonymize: bool = False, groups: list[int] = (), log_channel: int = 0):
+        self.anonymize = anonymize
+        self._key = secrets.token_bytes(16)
+        self._start = time.monotonic()
+        self._lock = threading.Lock()
+        start = time.time()
+        self.path = run_path(path, start)
+        self._file = gzip.open(self.path, 'wt', encoding='utf-8')
+        self._write({
+            'version': 1,
+            'start': start,
+            'anonymized': anonymize,
+            'groups': [self._map_id(x) for x in groups],
+            'log_channel': self._map_id(log_channel),
+        })
+        atexit.register(self.close)
+
+    def record_update(self, update: dict):
+        """
+        录制 getUpdates 返回的一个更新，不处理的更新类型会被忽略
+        """
+        for update_type in UPDATE_TYPES:
+            if update_type in update:
+                self.record(update_type, update[update_type])
+                return
+
+    def record(self, update_type: str, raw: dict):
+        if self.anonymize:
+            raw = self._anonymize(raw)
+        self._write({'t': round(time.monotonic() - self._start, 4), 'type': update_type, 'update': raw})
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+    def _write(self, data: dict):
+        line = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+        with self._lock:
+            if not self._file.closed:
+                self._file.write(line + '\n')
+
+    def _map_id(self, x: int) -> int:
+        if not self.anonymize or x == 0:
+            return x
+        digest = int.from_bytes(hmac.new(self._key, str(abs(x)).encode(), hashlib.sha256).digest()[:8], 'big')
+        # 保留符号与量级，使群组 ID 仍为负数
+        if x < 0:
+            return -(1000000000000 + digest % 1000000000)
+        return 1000000000 + digest % 1000000000
+
+    def _anonymize(self, data):
+        if isinstance(data, dict):
+            result = {}
+            for key, value in data.items():
+                if key in _id_keys and isinstance(value, int) and not isinstance(value, bool):
+                    result[key] = self._map_id(value)
+                elif key == 'username' and isinstance(value, str):
+                    result[key] = 'user_' + hmac.new(self._key, value.encode(), hashlib.sha256).hexdigest()[:10]
+                elif key == 'text' and isinstance(value, str):
+                    result[key] = _text_id_re.sub(lambda m: str(self._map_id(int(m.group()))), value)
+                else:
+                    result[key] = self._anonymize(value)
+            return result
+        elif isinstance(data, list):
+            return [self._anonymize(x) for x in data]
+        return data
+
+
+def read_log(path: str) -> tuple[dict, list[dict]]:
+    """
+    读取录制文件。进程异常退出留下的不完整结尾会被忽略；
+    几个录制文件被拼接在一起（出现多个文件头）时，后面各段的时间依次顺延，各段的群组合并
+    """
+    header = None
+    events = []
+    offset = 0.0
+    last_t = 0.0
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        try:
+            for line in f:
+                try:
+                    data = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if 'version' in data:
+                    if header is None:
+                        header = data
+                    else:
+                        offset = last_t
+                        header['groups'] += [x for x in data['groups'] if x not in header['groups']]
+                    continue
+                data['t'] += offset
+                last_t = data['t']
+                events.append(data)
+        except (EOFError, gzip.BadGzipFile, zlib.error):
+            pass
+    if header is None:
+        raise ValueError(f'{path}: missing header')
+    return header, events
+
+
+class StubBackend:
+    """
+    替代 Telegram Bot API、MediaWiki API 与 OAuth 查询的本地桩。所有站内账户都满足验证条件
+    """
+    bot_user = {'id': 1, 'is_bot': True, 'first_name': 'Replay', 'username': 'replay_bot'}
+
+    def __init__(self, tg_latency: float, mw_latency: float):
+        self.tg_latency = tg_latency
+        self.mw_latency = mw_latency
+        self._message_id = 0
+        self._lock = threading.Lock()
+
+    def telegram(self, method: str, data: dict):
+        if method == 'getMe':
+            return self.bot_user
+        elif method in ('sendMessage', 'editMessageText', 'sendDocument'):
+            with self._lock:
+                self._message_id += 1
+                message_id = self._message_id
+            return {
+                'message_id': data.get('message_id', message_id),
+                'from': self.bot_user,
+                'chat': {'id': int(data.get('chat_id', 0)), 'type': 'supergroup'},
+                'date': int(time.time()),
+                'text': data.get('text', ''),
+            }
+        elif method == 'getChatMember':
+            return {
+                'status': 'member',
+                'user': {'id': int(data['user_id']), 'is_bot': False, 'first_name': f'User {data["user_id"]}'},
+            }
+        elif method == 'getChat':
+            return {'id': int(data['chat_id']), 'type': 'supergroup', 'title': 'Replay', 'invite_link': ''}
+        elif method == 'getUpdates':
+            return []
+        return True
+
+    def mediawiki(self, params: dict) -> dict:
+        if 'guiuser' in params:
+            name = params['guiuser'].replace('_', ' ')
+            return {'query': {'globaluserinfo': {'id': self.mw_id_of(name), 'name': name}}}
+        mw_id = int(params['guiid'])
+        return {'query': {'globaluserinfo': {
+            'id': mw_id,
+            'name': f'Replay user {mw_id}',
+            'merged': [{'wiki': 'zhwiki', 'editcount': 1000, 'registration': '2010-01-01T00:00:00Z'}],
+        }}}
+
+    def oauth(self, telegram_id: str) -> dict:
+        return {'ok': True, 'mw_id': self.mw_id_of(telegram_id)}
+
+    @staticmethod
+    def mw_id_of(key: str) -> int:
+        return int.from_bytes(hashlib.sha256(key.encode()).digest()[:4], 'big')
+
+
+class _StubResponse:
+    def __init__(self, body: dict):
+        self.status_code = 200
+        self.ok = True
+        self._body = body
+        self.content = json.dumps(body).encode()
+        self.text = self.content.decode()
+
+    def json(self):
+        return self._body
+
+    def raise_for_status(self):
+        pass
+
+
+def install_sync_stubs(backend: StubBackend, oauth_url: str):
+    import mwclient
+    import requests
+
+    def route(method: str, url: str, **kwargs):
+        data = kwargs.get('json') or kwargs.get('data') or kwargs.get('params') or {}
+        if url == oauth_url:
+            time.sleep(backend.mw_latency)
+            return _StubResponse(backend.oauth(data['telegram_id']))
+        time.sleep(backend.tg_latency)
+        return _StubResponse({'ok': True, 'result': backend.telegram(url.rstrip('/').rsplit('/', 1)[-1], data)})
+
+    class StubSite:
+        def __init__(self, host, *args, **kwargs):
+            self.host = host
+
+        def api(self, **params):
+            time.sleep(backend.mw_latency)
+            return backend.mediawiki(params)
+
+    mwclient.Site = StubSite
+    requests.post = lambda url, **kwargs: route('POST', url, **kwargs)
+    requests.get = lambda url, **kwargs: route('GET', url, **kwargs)
+    requests.Session.request = lambda self, method, url, **kwargs: route(method, url, **kwargs)
+
+
+def make_async_stub_clients(backend: StubBackend, lock):
+    import asyncio
+    import aio
+
+    class StubTelegram(aio.AsyncTelegram):
+        def __init__(self):
+            super().__init__('', None)
+
+        async def api(self, method: str, data: dict, timeout: float = 30):
+            await asyncio.sleep(backend.tg_latency)
+            return backend.telegram(method, data)
+
+    class StubMediaWiki:
+        async def api(self, **params) -> dict:
+            await asyncio.sleep(backend.mw_latency)
+            return backend.mediawiki(params)
+
+    class StubClients:
+        telegram = StubTelegram()
+        mediawiki = StubMediaWiki()
+
+        async def post_json(self, url: str, payload: dict) -> Union[dict, None]:
+            await asyncio.sleep(backend.mw_latency)
+            return backend.oauth(payload['telegram_id'])
+
+    return StubClients(), aio.ThreadLockAdapter(lock)
+
+
+def prepare_workdir(config_path: str, header: dict) -> tuple[str, dict]:
+    with open(config_path, encoding='utf-8') as f:
+        config = json.load(f)
+    workdir = tempfile.mkdtemp(prefix='replay_')
+    config['record'] = os.path.join(workdir, 'record.json')
+    config.pop('update_record', None)
+    if 'ac_record_file' in config:
+        config['ac_record_file'] = os.path.join(workdir, 'ac_record.jsonl')
+    if header['anonymized']:
+        config['groups'] = header['groups']
+        config['log_channel'] = header['log_channel']
+    with open(os.path.join(workdir, 'config.json'), 'w', encoding='utf-8') as f:
+        json.dump(config, f, ensure_ascii=False)
+    with open(config['record'], 'w', encoding='utf-8') as f:
+        json.dump({}, f)
+    return workdir, config
+
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def summarize(latencies: dict[str, list[float]], wall: float, updates: int) -> dict:
+    all_latencies = [x for values in latencies.values() for x in values]
+    result = {
+        'updates': updates,
+        'handled': len(all_latencies),
+        'wall_s': wall,
+        'throughput_per_s': len(all_latencies) / wall if wall else 0,
+        'handlers': {},
+    }
+    for name, values in sorted(latencies.items()) + [('(all)', all_latencies)]:
+        result['handlers'][name] = {
+            'count': len(values),
+            'p50_ms': percentile(values, 0.5) * 1000,
+            'p90_ms': percentile(values, 0.9) * 1000,
+            'p99_ms': percentile(values, 0.99) * 1000,
+            'max_ms': max(values, default=0) * 1000,
+        }
+    return result
+
+
+def replay_sync(main, events: list[dict], max_speed: bool, workers: int) -> tuple[dict, float]:
+    import concurrent.futures
+    import catbot
+
+    update_types = {'message': catbot.Message, 'callback_query': catbot.CallbackQuery,
+                    'chat_member': catbot.ChatMemberUpdate}
+    tasks = main.task_table(use_async=False)
+    latencies: dict[str, list[float]] = {}
+    lat_lock = threading.Lock()
+
+    def run(handler, obj, arrived: float):
+        try:
+            handler(obj)
+        except Exception as e:
+            print(f'[Error] {handler.__name__}: {e!r}')
+        # 从更新到达时算起，包括在线程池中排队的时间
+        with lat_lock:
+            latencies.setdefault(handler.__name__, []).append(time.perf_counter() - arrived)
+
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        for event in events:
+            if not max_speed:
+                time.sleep(max(0.0, event['t'] - (time.perf_counter() - start)))
+            arrived = time.perf_counter()
+            obj = update_types[event['type']](event['update'])
+            for criteria, handler in tasks.get(event['type'], []):
+                if criteria(obj):
+                    executor.submit(run, handler, obj, arrived)
+    return latencies, time.perf_counter() - start
+
+
+def replay_async(main, events: list[dict], max_speed: bool) -> tuple[dict, float]:
+    """
+    与 async_mode 一样通过 AsyncRunner 分发，同时处理数与线程数取自 config
+    """
+    import asyncio
+    import aio
+
+    latencies: dict[str, list[float]] = {}
+    runner = aio.AsyncRunner(
+        main.aio_clients,
+        main.task_table(use_async=True),
+        max_inflight=main.bot.config.get('async_max_inflight', 1000),
+        max_workers=main.bot.config.get('async_max_workers', 16),
+        on_handled=lambda name, elapsed: latencies.setdefault(name, []).append(elapsed)
+    )
+
+    async def drive():
+        runner.open()
+        start = time.perf_counter()
+        for event in events:
+            if not max_speed:
+                await asyncio.sleep(max(0.0, event['t'] - (time.perf_counter() - start)))
+            await runner.dispatch({event['type']: event['update']})
+        await runner.drain()
+        return time.perf_counter() - start
+
+    try:
+        wall = asyncio.run(drive())
+    finally:
+        runner.executor.shutdown(wait=True)
+    return latencies, wall
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay recorded updates against stubbed backends.')
+    parser.add_argument('log')
+    parser.add_argument('--config', default='config.json')
+    parser.add_argument('--speed', choices=['original', 'max'], default='original')
+    parser.add_argument('--async', dest='use_async', action='store_true', help='use the async_mode handlers')
+    parser.add_argument('--workers', type=int, default=64, help='handler threads in sync mode')
+    parser.add_argument('--tg-latency', type=float, default=0, help='simulated Telegram API latency in ms')
+    parser.add_argument('--mw-latency', type=float, default=0, help='simulated MediaWiki/OAuth latency in ms')
+    parser.add_argument('--json', help='write the summary to this file')
+    args = parser.parse_args()
+
+    header, events = read_log(args.log)
+    backend = StubBackend(args.tg_latency / 1000, args.mw_latency / 1000)
+    workdir, config = prepare_workdir(args.config, header)
+    install_sync_stubs(backend, config['oauth_query_url'])
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    json_path = os.path.abspath(args.json) if args.json else None
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        import main as bot_main
+        if args.use_async:
+            bot_main.aio_clients, bot_main.a_lock = make_async_stub_clients(backend, bot_main.t_lock)
+            latencies, wall = replay_async(bot_main, events, args.speed == 'max')
+        else:
+            latencies, wall = replay_sync(bot_main, events, args.speed == 'max', args.workers)
+        bot_main.restriction_worker.join()
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    result = summarize(latencies, wall, len(events))
+    print(f'{result["updates"]} updates, {result["handled"]} handler runs in {wall:.2f} s '
+          f'({result["throughput_per_s"]:.1f}/s)')
+    print(f'{"handler":<28} {"count":>7} {"p50 ms":>9} {"p90 ms":>9} {"p99 ms":>9} {"max ms":>9}')
+    for name, stats in result['handlers'].items():
+        print(f'{name:<28} {stats["count"]:>7} {stats["p50_ms"]:>9.2f} {stats["p90_ms"]:>9.2f} '
+              f'{stats["p99_ms"]:>9.2f} {stats["max_ms"]:>9.2f}')
+    if json_path:
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+import threading
+import time
+from collections import Counter
+from typing import Iterable, Union
+
+from acrecord import AcRecord
+
+_default_state = (False, False, False, frozenset())
+
+
+class GroupStats:
+    """
+    增量维护的统计：已验证、验证中、禁止验证的人数，各群白名单人数，以及按日（UTC）统计的
+    验证、解除验证和各群入群次数。每次修改 AcRecord 前用 snapshot 取得旧状态，修改后调用 update
+    """
+    def __init__(self, data: Union[dict, None] = None, history_days: int = 90):
+        self.history_days = history_days
+        self.confirmed = 0
+        self.confirming = 0
+        self.refused = 0
+        self.whitelisted: Counter[int] = Counter()
+        self.history: dict[str, Counter[str]] = {}
+        """
+        日期 -> 事件计数，事件为 confirm、deconfirm 或 join <chat_id>
+        """
+        self._lock = threading.Lock()
+        if data is not None:
+            self.confirmed = data['confirmed']
+            self.confirming = data['confirming']
+            self.refused = data['refused']
+            self.whitelisted = Counter({int(k): v for k, v in data['whitelisted'].items()})
+            self.history = {day: Counter(events) for day, events in data['history'].items()}
+
+    def dump(self) -> dict:
+        with self._lock:
+            return {
+                'confirmed': self.confirmed,
+                'confirming': self.confirming,
+                'refused': self.refused,
+                'whitelisted': {str(k): v for k, v in self.whitelisted.items() if v},
+                'history': {day: dict(events) for day, events in self.history.items()},
+            }
+
+    @classmethod
+    def rebuild(cls, records: Iterable[dict], history_days: int = 90):
+        """
+        没有保存的统计时，由记录的字典形式完整统计一次。历史无法恢复，从空开始
+        """
+        obj = cls(history_days=history_days)
+        for data in records:
+            obj.confirmed += data['confirmed']
+            obj.confirming += data['confirming']
+            obj.refused += data['refused']
+            for chat_id, reason in data['whitelist_reason'].items():
+                if reason:
+                    obj.whitelisted[int(chat_id)] += 1
+        return obj
+
+    @staticmethod
+    def snapshot(ac_record: Union[AcRecord, None]) -> tuple:
+        if ac_record is None:
+            return _default_state
+        return (
+            ac_record.confirmed,
+            ac_record.confirming,
+            ac_record.refused,
+            frozenset(chat_id for chat_id, reason in ac_record.whitelist_reason.items() if reason),
+        )
+
+    def update(self, before: tuple, ac_record: AcRecord):
+        after = self.snapshot(ac_record)
+        if before == after:
+            return
+        with self._lock:
+            self.confirmed += after[0] - before[0]
+            self.confirming += after[1] - before[1]
+            self.refused += after[2] - before[2]
+            for chat_id in after[3] - before[3]:
+                self.whitelisted[chat_id] += 1
+            for chat_id in before[3] - after[3]:
+                self.whitelisted[chat_id] -= 1
+            if after[0] and not before[0]:
+                self._event('confirm')
+            elif before[0] and not after[0]:
+                self._event('deconfirm')
+
+    def record_join(self, chat_id: int):
+        with self._lock:
+            self._event(f'join {chat_id}')
+
+    def recent(self, days: int) -> list[tuple[str, Counter[str]]]:
+        """
+        最近 days 天（含今天）每天的事件计数，按日期从新到旧
+        """
+        now = time.time()
+        with self._lock:
+            return [
+                (day, Counter(self.history.get(day, {})))
+                for day in (time.strftime('%Y-%m-%d', time.gmtime(now - i * 86400)) for i in range(days))
+            ]
+
+    def _event(self, event: str):
+        day = time.strftime('%Y-%m-%d', time.gmtime())
+        if day not in self.history:
+            self.history[day] = Counter()
+            for old_day in sorted(self.history)[:-self.history_days]:
+                del self.history[old_day]
+        self.history[day][event] += 1
@@ -0,0 +1,91 @@
+import json
+
+from acrecord import AcRecord, AcRecordStore, whitelist_reason_of
+
+
+def make_record(telegram_id: int, confirmed: bool = False, mw_id: int = -1) -> AcRecord:
+    ac_record = AcRecord(telegram_id)
+    ac_record.confirmed = confirmed
+    ac_record.mw_id = mw_id
+    return ac_record
+
+
+def test_dump_file_writes_json_lines(tmp_path):
+    path = str(tmp_path / 'ac_record.jsonl')
+    store = AcRecordStore([make_record(111, True, 5).to_dict()])
+    store.get_or_create(222).whitelist_reason[-100] = 'bot'
+    store.dump_file(path)
+
+    with open(path, encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    assert [json.loads(line)['telegram_id'] for line in lines] == [111, 222]
+    assert all(line.startswith('{"telegram_id": ') for line in lines)
+
+
+def test_from_file_round_trip_is_lazy(tmp_path):
+    path = str(tmp_path / 'ac_record.jsonl')
+    AcRecordStore([make_record(111, True, 5), make_record(222)]).dump_file(path)
+
+    store = AcRecordStore.from_file(path)
+    assert len(store) == 2
+    assert all(isinstance(x, str) for x in store._items)
+    ac_record = store.get(111)
+    assert ac_record.confirmed and ac_record.mw_id == 5
+    assert isinstance(store._items[0], AcRecord) and isinstance(store._items[1], str)
+    assert store.get(333) is None
+
+
+def test_from_file_missing_uses_fallback(tmp_path):
+    store = AcRecordStore.from_file(str(tmp_path / 'missing.jsonl'), fallback=[make_record(111).to_dict()])
+    assert store.get(111).telegram_id == 111
+
+
+def test_index_accepts_rewritten_lines(tmp_path):
+    path = tmp_path / 'ac_record.jsonl'
+    data = make_record(111, True).to_dict()
+    path.write_text(json.dumps(data) + '\n', encoding='utf-8')
+    assert AcRecordStore.from_file(str(path)).get(111).confirmed
+
+
+def test_duplicate_telegram_id_keeps_first():
+    store = AcRecordStore([make_record(111, True).to_dict(), make_record(111, False).to_dict()])
+    assert store.get(111).confirmed
+
+
+def test_iter_raw_and_to_list_do_not_materialize(tmp_path):
+    path = str(tmp_path / 'ac_record.jsonl')
+    AcRecordStore([make_record(111, True), make_record(222)]).dump_file(path)
+    store = AcRecordStore.from_file(path)
+    assert [x['confirmed'] for x in store.iter_raw()] == [True, False]
+    assert [x['telegram_id'] for x in store.to_list()] == [111, 222]
+    assert all(isinstance(x, str) for x in store._items)
+
+
+def test_append_after_index_built():
+    store = AcRecordStore()
+    assert store.get(111) is None
+    ac_record = store.get_or_create(111)
+    assert store.get(111) is ac_record
+    assert [x.telegram_id for x in store] == [111]
+
+
+def test_snapshot_copies_materialized_records():
+    store = AcRecordStore([make_record(111).to_dict()])
+    ac_record = store.get(111)
+    snapshot = store.snapshot()
+    ac_record.confirmed = True
+    store.get_or_create(222)
+    assert [x['confirmed'] for x in snapshot.iter_raw()] == [False]
+
+
+def test_whitelist_reason_of_raw_and_materialized(tmp_path):
+    path = str(tmp_path / 'ac_record.jsonl')
+    ac_record = make_record(111)
+    ac_record.whitelist_reason[-100] = 'bot'
+    AcRecordStore([ac_record, make_record(222)]).dump_file(path)
+
+    store = AcRecordStore.from_file(path)
+    store.get(222).whitelist_reason[-100] = 'later'
+    assert [whitelist_reason_of(x, -100) for x in store.iter_raw()] == ['bot', 'later']
+    assert [whitelist_reason_of(x, -200) for x in store.iter_raw()] == ['', '']
+    assert isinstance(store._items[0], str)
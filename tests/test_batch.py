@@ -0,0 +1,42 @@
+import json
+
+from batch import parse_id_tokens, parse_whitelist_file
+
+
+def test_parse_id_tokens_separators():
+    assert parse_id_tokens(['111', '222,333', '444,']) == ([111, 222, 333, 444], [])
+
+
+def test_parse_id_tokens_stops_at_reason():
+    assert parse_id_tokens(['111', 'spam', 'bot']) == ([111], ['spam', 'bot'])
+
+
+def test_parse_id_tokens_keeps_partial_token_in_reason():
+    assert parse_id_tokens(['111', '222,abc', 'note']) == ([111], ['222,abc', 'note'])
+
+
+def test_parse_id_tokens_keeps_duplicates():
+    assert parse_id_tokens(['111', '111,222']) == ([111, 111, 222], [])
+
+
+def test_parse_whitelist_file_json_list():
+    content = json.dumps([111, {'telegram_id': 222, 'reason': 'bot'}, {'telegram_id': '333'}]).encode()
+    assert parse_whitelist_file(content, 'default') == ({111: 'default', 222: 'bot', 333: 'default'}, 0)
+
+
+def test_parse_whitelist_file_json_export_format():
+    content = json.dumps({'chat_id': -100, 'whitelist': [
+        {'telegram_id': 111, 'reason': 'first'},
+        {'telegram_id': 111, 'reason': 'second'},
+    ]}).encode()
+    assert parse_whitelist_file(content, 'default') == ({111: 'first'}, 1)
+
+
+def test_parse_whitelist_file_csv():
+    content = 'telegram_id,reason\n111,bot\n\nabc,x\n222\n111,again\n'.encode('utf-8-sig')
+    assert parse_whitelist_file(content, 'default') == ({111: 'bot', 222: 'default'}, 2)
+
+
+def test_parse_whitelist_file_json_skips_bad_items():
+    content = json.dumps([111, 'abc', {'id': 2}, {'telegram_id': None}, [3], {'telegram_id': 222}]).encode()
+    assert parse_whitelist_file(content, 'default') == ({111: 'default', 222: 'default'}, 4)
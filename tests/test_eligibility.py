@@ -0,0 +1,76 @@
+import asyncio
+import time
+
+from eligibility import EligibilityEngine
+
+
+def account(wiki='zhwiki', editcount=100, days=30, **kwargs):
+    registration = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(time.time() - days * 86400))
+    return {'wiki': wiki, 'editcount': editcount, 'registration': registration, **kwargs}
+
+
+def query(*accounts, **info):
+    return {'query': {'globaluserinfo': {'merged': list(accounts), **info}}}
+
+
+def test_evaluate_eligible_account():
+    result = EligibilityEngine({}, []).evaluate(1, query(account(editcount=10), account('enwiki')))
+    assert result.eligible and result.reason == 'eligible' and result.wiki == 'enwiki'
+
+
+def test_evaluate_thresholds():
+    engine = EligibilityEngine({'min_edits': 50, 'min_age_days': 7}, [])
+    assert not engine.evaluate(1, query(account(editcount=49))).eligible
+    assert not engine.evaluate(1, query(account(days=6))).eligible
+    assert engine.evaluate(1, query({'wiki': 'zhwiki', 'editcount': 50, 'registration': None})).eligible
+
+
+def test_evaluate_not_found():
+    result = EligibilityEngine({}, []).evaluate(1, {'error': {'code': 'nosuchuser'}})
+    assert not result.eligible and result.reason == 'not_found'
+
+
+def test_evaluate_wiki_list():
+    engine = EligibilityEngine({'use_wiki_list': True}, ['zhwiki'])
+    assert not engine.evaluate(1, query(account('enwiki'))).eligible
+    assert engine.evaluate(1, query(account('enwiki'), account('zhwiki'))).wiki == 'zhwiki'
+
+
+def test_evaluate_locked_and_blocked():
+    assert EligibilityEngine({}, []).evaluate(1, query(account(), locked=True)).eligible
+    assert EligibilityEngine({'reject_locked': True}, []).evaluate(1, query(account(), locked=True)).reason == 'locked'
+    engine = EligibilityEngine({'reject_blocked': True}, [])
+    assert not engine.evaluate(1, query(account(blocked={'expiry': 'infinity'}))).eligible
+
+
+def test_check_caches_only_eligible_results():
+    engine = EligibilityEngine({}, [])
+    calls = []
+
+    def fetch(mw_id):
+        calls.append(mw_id)
+        return query(account(editcount=100 if mw_id == 1 else 0))
+
+    assert engine.check(1, fetch).eligible
+    assert engine.check(1, fetch).eligible
+    assert not engine.check(2, fetch).eligible
+    assert not engine.check(2, fetch).eligible
+    assert calls == [1, 2, 2]
+
+
+def test_check_async_shares_cache():
+    engine = EligibilityEngine({}, [])
+
+    async def fetch(mw_id):
+        return query(account())
+
+    assert asyncio.run(engine.check_async(1, fetch)).eligible
+    assert engine.check(1, lambda mw_id: {'error': {}}).eligible
+
+
+def test_cache_evicts_expired_results():
+    engine = EligibilityEngine({'cache_ttl': 60}, [])
+    engine.check(1, lambda mw_id: query(account()))
+    engine._cache[1].checked_time -= 120
+    engine.check(2, lambda mw_id: query(account()))
+    assert list(engine._cache) == [2]
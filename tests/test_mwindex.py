@@ -0,0 +1,93 @@
+import time
+
+from mwindex import MwUsernameIndex, normalize_username
+
+
+def make_index() -> MwUsernameIndex:
+    index = MwUsernameIndex()
+    index.add(1, 101, 'Alice')
+    index.add(2, 102, 'ALICE')
+    index.add(3, 103, 'Alicia')
+    index.add(4, 104, 'Bob smith')
+    return index
+
+
+def test_normalize_username():
+    assert normalize_username('  bob__smith ') == 'Bob smith'
+
+
+def test_find_prefers_exact_name():
+    assert make_index().find('Alice') == [(1, 'Alice')]
+
+
+def test_find_case_insensitive_returns_all():
+    assert make_index().find('aLiCe') == [(2, 'ALICE'), (1, 'Alice')]
+
+
+def test_find_does_not_match_prefix():
+    assert make_index().find('Ali') == []
+    assert make_index().find('bob') == []
+
+
+def test_search_prefix():
+    index = make_index()
+    assert index.search_prefix('ali') == [(2, 'ALICE'), (1, 'Alice'), (3, 'Alicia')]
+    assert index.search_prefix('ali', limit=1) == [(2, 'ALICE')]
+    assert index.search_prefix('bob_') == [(4, 'Bob smith')]
+    assert index.search_prefix('carol') == []
+
+
+def test_remove_and_rename():
+    index = make_index()
+    index.remove(1)
+    assert index.find('Alice') == [(2, 'ALICE')]
+    index.set_name(3, 'Carol')
+    assert index.find('Alicia') == []
+    assert index.find('carol') == [(3, 'Carol')]
+    index.set_name(99, 'Unknown')
+    assert index.find('Unknown') == []
+
+
+def test_dump_round_trip():
+    index = MwUsernameIndex(make_index().dump())
+    assert index.owner(4) == 104
+    assert index.search_prefix('a') == [(2, 'ALICE'), (1, 'Alice'), (3, 'Alicia')]
+
+
+def test_refresh_syncs_owners_and_fetches_missing_names():
+    index = make_index()
+    fetched = []
+
+    def fetch_name(mw_id):
+        fetched.append(mw_id)
+        return f'User {mw_id}'
+
+    index.refresh(lambda: [(1, 101), (5, 105)], fetch_name, fetch_rate=1000)
+    assert index.ready
+    assert index.owner(2) is None and index.owner(5) == 105
+    assert fetched == [5]
+    assert index.find('user 5') == [(5, 'User 5')]
+
+
+def test_refresh_keeps_changes_made_during_load():
+    index = MwUsernameIndex()
+
+    def load_confirmed():
+        index.add(7, 107, 'Added')
+        return []
+
+    index.refresh(load_confirmed, lambda mw_id: None, fetch_rate=1000)
+    assert index.owner(7) == 107
+
+
+def test_refresh_throttles_fetches():
+    index = MwUsernameIndex()
+    calls = []
+
+    def fetch_name(mw_id):
+        calls.append(time.monotonic())
+        return None
+
+    index.refresh(lambda: [(i, i) for i in range(4)], fetch_name, fetch_rate=50)
+    assert len(calls) == 4
+    assert calls[-1] - calls[0] >= 3 / 50 * 0.9
@@ -0,0 +1,71 @@
+import threading
+import time
+from collections import Counter
+
+from profiler import ContendedLock, SamplingProfiler
+
+HANDLER_CODE = '''
+import sys
+
+
+def handler(lock):
+    with lock:
+        pass
+
+
+module_frame = sys._getframe()
+'''
+
+
+def load_handler(path: str) -> dict:
+    namespace = {'__name__': 'main'}
+    exec(compile(HANDLER_CODE, path, 'exec'), namespace)
+    return namespace
+
+
+def test_sample_labels_lock_wait_and_skips_idle_threads(tmp_path):
+    path = str(tmp_path / 'main.py')
+    handler = load_handler(path)['handler']
+    lock = ContendedLock('t_lock')
+    idle = threading.Event()
+    lock.acquire()
+    worker = threading.Thread(target=handler, args=(lock,))
+    idler = threading.Thread(target=idle.wait)
+    worker.start()
+    idler.start()
+    try:
+        deadline = time.monotonic() + 5
+        while worker.ident not in lock.waiting and time.monotonic() < deadline:
+            time.sleep(0.001)
+        stacks, samples, threads = SamplingProfiler(path, [lock], interval=0.001)._sample(0.05)
+    finally:
+        lock.release()
+        idle.set()
+        worker.join()
+        idler.join()
+
+    assert samples > 0
+    assert threads == {worker.ident}
+    for stack in stacks:
+        assert 'main:handler' in stack
+        assert stack[-1] == '[lock wait: t_lock]'
+
+
+def test_walk_ignores_module_level_frames(tmp_path):
+    path = str(tmp_path / 'main.py')
+    profiler = SamplingProfiler(path)
+    assert profiler._walk(load_handler(path)['module_frame']) is None
+
+
+def test_report_without_handler_samples():
+    assert SamplingProfiler._report(Counter(), 3, set(), 0.5) == \
+        'Profile: 0.5 s, 3 samples, no handler thread was running.\n'
+
+
+def test_report_categories_and_handlers():
+    stack = ('main:<module>', 'main:handler', 'profiler:ContendedLock.acquire', '[lock wait: t_lock]')
+    report = SamplingProfiler._report(Counter({stack: 2}), 4, {1}, 1)
+    categories, handlers = report.split('\n\n')[1:3]
+    assert '100.0%       2  lock wait: t_lock' in categories
+    assert [x.split() for x in handlers.splitlines()[1:]] == [['100.0%', '2', 'handler']]
+    assert f'{";".join(stack)} 2' in report
@@ -0,0 +1,45 @@
+import time
+
+from ratelimit import RateLimitedWorker, is_rate_limited
+
+
+def test_is_rate_limited():
+    assert is_rate_limited(Exception('Too Many Requests: retry after 3'))
+    assert not is_rate_limited(Exception('Bad Request: user not found'))
+
+
+def test_worker_retries_rate_limited_calls():
+    calls = []
+
+    def flaky():
+        calls.append(time.monotonic())
+        if len(calls) < 3:
+            raise Exception('Too Many Requests: retry after 0')
+
+    worker = RateLimitedWorker(1000, max_retries=3)
+    worker.submit(flaky)
+    worker.join()
+    assert len(calls) == 3
+
+
+def test_worker_does_not_retry_other_errors():
+    calls = []
+
+    def failing():
+        calls.append(1)
+        raise Exception('Bad Request')
+
+    worker = RateLimitedWorker(1000)
+    worker.submit(failing)
+    worker.join()
+    assert len(calls) == 1
+
+
+def test_worker_paces_calls():
+    calls = []
+    worker = RateLimitedWorker(50, burst=1)
+    for _ in range(6):
+        worker.submit(lambda: calls.append(time.monotonic()))
+    worker.join()
+    assert len(calls) == 6
+    assert calls[-1] - calls[0] >= 5 / 50 * 0.9
@@ -0,0 +1,90 @@
+import gzip
+import json
+import os
+
+from replay import UpdateRecorder, read_log, run_path
+
+
+def message(user_id, chat_id, text='hello', username='alice'):
+    return {
+        'message_id': 1,
+        'from': {'id': user_id, 'is_bot': False, 'first_name': 'A', 'username': username},
+        'chat': {'id': chat_id, 'type': 'supergroup'},
+        'text': text,
+    }
+
+
+def test_run_path():
+    path = run_path(os.path.join('logs', 'updates.jsonl.gz'), 0)
+    name = os.path.basename(path)
+    assert os.path.dirname(path) == 'logs'
+    assert name.startswith('updates-') and name.endswith('.jsonl.gz')
+    assert run_path('updates', 0).startswith('updates-')
+
+
+def test_anonymize_maps_ids_consistently(tmp_path):
+    recorder = UpdateRecorder(str(tmp_path / 'u.jsonl.gz'), anonymize=True, groups=[-1001234567890])
+    first = recorder._anonymize(message(123456789, -1001234567890, text='/whois 123456789'))
+    second = recorder._anonymize(message(123456789, -1001234567890, username='alice'))
+    recorder.close()
+
+    user_id = first['from']['id']
+    assert user_id != 123456789 and user_id > 0
+    assert first['chat']['id'] < 0
+    assert second['from']['id'] == user_id and second['chat']['id'] == first['chat']['id']
+    assert first['text'] == f'/whois {user_id}'
+    assert first['from']['username'] == second['from']['username'] != 'alice'
+    assert first['from']['first_name'] == 'A' and first['message_id'] == 1
+
+
+def test_anonymize_keys_differ_between_recorders(tmp_path):
+    a = UpdateRecorder(str(tmp_path / 'a.jsonl.gz'), anonymize=True)
+    b = UpdateRecorder(str(tmp_path / 'b.jsonl.gz'), anonymize=True)
+    assert a._map_id(123456789) != b._map_id(123456789)
+    assert a._map_id(0) == 0
+    a.close()
+    b.close()
+
+
+def test_record_and_read_log(tmp_path):
+    recorder = UpdateRecorder(str(tmp_path / 'u.jsonl.gz'), groups=[-100], log_channel=-200)
+    recorder.record_update({'update_id': 1, 'message': message(1, -100)})
+    recorder.record_update({'update_id': 2, 'callback_query': {'id': 'x', 'data': 'confirm'}})
+    recorder.record_update({'update_id': 3, 'my_chat_member': {}})
+    recorder.close()
+
+    header, events = read_log(recorder.path)
+    assert header['groups'] == [-100] and header['log_channel'] == -200
+    assert [x['type'] for x in events] == ['message', 'callback_query']
+
+
+def test_read_log_truncated_tail(tmp_path):
+    recorder = UpdateRecorder(str(tmp_path / 'u.jsonl.gz'))
+    for i in range(20):
+        recorder.record('message', message(i, -100))
+    recorder.close()
+    with open(recorder.path, 'rb') as f:
+        data = f.read()
+    with open(recorder.path, 'wb') as f:
+        f.write(data[:-8])
+
+    header, events = read_log(recorder.path)
+    assert header['version'] == 1
+    assert len(events) == 20
+
+
+def test_read_log_concatenated_runs(tmp_path):
+    path = tmp_path / 'joined.jsonl.gz'
+    lines = [
+        {'version': 1, 'start': 0, 'anonymized': False, 'groups': [-100], 'log_channel': -200},
+        {'t': 1.0, 'type': 'message', 'update': {}},
+        {'t': 2.0, 'type': 'message', 'update': {}},
+        {'version': 1, 'start': 10, 'anonymized': False, 'groups': [-100, -300], 'log_channel': -200},
+        {'t': 0.5, 'type': 'message', 'update': {}},
+    ]
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        f.write('\n'.join(json.dumps(x) for x in lines) + '\n{"t": 3')
+
+    header, events = read_log(str(path))
+    assert header['groups'] == [-100, -300]
+    assert [x['t'] for x in events] == [1.0, 2.0, 2.5]
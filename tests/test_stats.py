@@ -0,0 +1,71 @@
+import time
+
+from acrecord import AcRecord
+from stats import GroupStats
+
+
+def today() -> str:
+    return time.strftime('%Y-%m-%d', time.gmtime())
+
+
+def test_update_tracks_state_changes():
+    stats = GroupStats()
+    ac_record = AcRecord(111)
+    before = stats.snapshot(None)
+    ac_record.confirming = True
+    stats.update(before, ac_record)
+    assert (stats.confirmed, stats.confirming) == (0, 1)
+
+    before = stats.snapshot(ac_record)
+    ac_record.confirming = False
+    ac_record.confirmed = True
+    ac_record.whitelist_reason[-100] = 'bot'
+    stats.update(before, ac_record)
+    assert (stats.confirmed, stats.confirming, stats.whitelisted[-100]) == (1, 0, 1)
+
+    before = stats.snapshot(ac_record)
+    ac_record.confirmed = False
+    ac_record.refused = True
+    ac_record.whitelist_reason[-100] = ''
+    stats.update(before, ac_record)
+    assert (stats.confirmed, stats.refused, stats.whitelisted[-100]) == (0, 1, 0)
+    assert stats.history[today()]['confirm'] == 1
+    assert stats.history[today()]['deconfirm'] == 1
+
+
+def test_update_without_change_records_nothing():
+    stats = GroupStats()
+    ac_record = AcRecord(111)
+    stats.update(stats.snapshot(ac_record), ac_record)
+    assert stats.history == {}
+
+
+def test_rebuild_matches_incremental_counts():
+    records = []
+    for i, (confirmed, refused, reason) in enumerate([(True, False, 'bot'), (False, True, ''), (True, False, '')]):
+        ac_record = AcRecord(i)
+        ac_record.confirmed = confirmed
+        ac_record.refused = refused
+        ac_record.whitelist_reason[-100] = reason
+        records.append(ac_record.to_dict())
+    stats = GroupStats.rebuild(records)
+    assert (stats.confirmed, stats.confirming, stats.refused) == (2, 0, 1)
+    assert stats.whitelisted == {-100: 1}
+
+
+def test_dump_round_trip_and_recent():
+    stats = GroupStats()
+    stats.record_join(-100)
+    stats.record_join(-100)
+    restored = GroupStats(stats.dump())
+    recent = restored.recent(3)
+    assert len(recent) == 3
+    assert recent[0] == (today(), {'join -100': 2})
+    assert recent[1][1] == {}
+
+
+def test_history_is_trimmed():
+    stats = GroupStats(history_days=2)
+    stats.history = {'2000-01-01': {'confirm': 1}, '2000-01-02': {'confirm': 1}}
+    stats.record_join(-100)
+    assert sorted(stats.history) == ['2000-01-02', today()]